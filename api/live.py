@@ -0,0 +1,148 @@
+# KorpBot/api/live.py
+
+import asyncio
+import json
+import logging
+
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+
+from database.main import async_session, engine
+from poll_state import POLL_CHANGES_CHANNEL, get_poll_tallies
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = 15
+
+
+class PollChangeFeed:
+    """
+    Общая лента изменений опросов для живых отчетов.
+    На процесс API держится одна подписка LISTEN на канал Postgres; при изменении
+    опроса итоги перечитываются один раз и рассылаются всем открытым вкладкам.
+    Всплески голосов схлопываются: не больше одного перечитывания за debounce_seconds.
+    """
+
+    def __init__(self, debounce_seconds: float = 0.5):
+        self.debounce = debounce_seconds
+        self._subscribers: dict[int, set[asyncio.Queue]] = {}
+        self._pending: set[int] = set()
+        # Ссылки на задачи перечитывания: без них задачу может собрать сборщик мусора
+        self._tasks: set[asyncio.Task] = set()
+        self._connection = None
+        self._lock = asyncio.Lock()
+
+    async def subscribe(self, poll_id: int) -> asyncio.Queue:
+        await self._ensure_listener()
+        # Медленному клиенту нужна только самая свежая сводка
+        queue = asyncio.Queue(maxsize=1)
+        self._subscribers.setdefault(poll_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, poll_id: int, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(poll_id)
+        if queues:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[poll_id]
+
+    def publish(self, poll_id: int) -> None:
+        """Сообщает, что опрос изменился (вызывается из LISTEN или внутри процесса)."""
+        if poll_id in self._subscribers and poll_id not in self._pending:
+            self._pending.add(poll_id)
+            task = asyncio.get_running_loop().create_task(self._refresh(poll_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._refresh_done)
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    async def _refresh(self, poll_id: int) -> None:
+        await asyncio.sleep(self.debounce)
+        self._pending.discard(poll_id)
+        try:
+            async with async_session() as session:
+                message = tallies_message(await get_poll_tallies(session, poll_id))
+        except Exception as e:
+            logger.warning(f"Не удалось перечитать итоги опроса {poll_id}: {e}")
+            return
+        for queue in self._subscribers.get(poll_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    def _refresh_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Ошибка обновления живого отчета: {task.exception()!r}")
+
+    async def _ensure_listener(self) -> None:
+        if self._connection is not None:
+            return
+        async with self._lock:
+            if self._connection is not None:
+                return
+            connection = await engine.connect()
+            try:
+                raw = await connection.get_raw_connection()
+                await raw.driver_connection.add_listener(POLL_CHANGES_CHANNEL, self._on_notify)
+                raw.driver_connection.add_termination_listener(self._on_terminate)
+            except Exception as e:
+                # Например, не Postgres: отчеты просто не будут обновляться сами
+                logger.warning(f"Живые обновления отчетов недоступны: {e}")
+                await connection.close()
+                return
+            self._connection = connection
+            logger.info(f"Подписка на канал '{POLL_CHANGES_CHANNEL}' установлена.")
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        try:
+            self.publish(int(payload))
+        except ValueError:
+            logger.warning(f"Некорректное уведомление в канале {channel}: {payload!r}")
+
+    def _on_terminate(self, connection) -> None:
+        logger.warning("Подписка на изменения опросов потеряна, переподключение при следующем клиенте.")
+        self._connection = None
+
+
+def tallies_message(tallies: list) -> str:
+    return json.dumps({
+        "labels": [row.option_text for row in tallies],
+        "values": [row.votes for row in tallies],
+        "total": sum(row.votes for row in tallies),
+    }, ensure_ascii=False)
+
+
+change_feed = PollChangeFeed()
+
+
+@router.get("/report/{poll_id}/events", summary="Живые итоги опроса (Server-Sent Events)")
+async def stream_poll_events(request: Request, poll_id: int):
+    """Отправляет текущие итоги опроса, а затем — новые при каждом изменении."""
+
+    async def event_stream():
+        queue = await change_feed.subscribe(poll_id)
+        try:
+            async with async_session() as session:
+                yield f"data: {tallies_message(await get_poll_tallies(session, poll_id))}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield f"data: {message}\n\n"
+        finally:
+            change_feed.unsubscribe(poll_id, queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
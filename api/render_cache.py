@@ -0,0 +1,81 @@
+# KorpBot/api/render_cache.py
+
+import gzip
+from collections import OrderedDict
+
+import orjson
+from fastapi import Request, Response
+
+from config import REPORT_CACHE_SIZE
+
+
+class RenderCache:
+    """
+    Ограниченный LRU-кэш готовых тел ответов, хранящихся в сжатом gzip виде.
+    Ключ включает версию опроса, поэтому после изменения опроса старая запись
+    больше не находится и со временем вытесняется.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[tuple, bytes] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> bytes | None:
+        body = self._entries.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, key: tuple, body: str) -> bytes:
+        compressed = gzip.compress(body.encode("utf-8"))
+        self._entries[key] = compressed
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return compressed
+
+
+report_cache = RenderCache(maxsize=REPORT_CACHE_SIZE)
+
+
+def make_etag(kind: str, *parts) -> str:
+    """Строгий ETag вида "report-15-42"."""
+    return '"' + "-".join([kind, *map(str, parts)]) + '"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """Проверяет If-None-Match: совпал ли ETag клиента с текущим."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+class FastJSONResponse(Response):
+    """
+    JSON-ответ, который кодирует готовые dict/list через orjson, без Pydantic-валидации.
+    Для маршрутов, которые сами собирают тело из простых строк БД.
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def compressed_html_response(request: Request, compressed: bytes, etag: str) -> Response:
+    """Отдает сжатое тело как есть, если клиент понимает gzip, иначе распаковывает."""
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=compressed, media_type="text/html; charset=utf-8", headers=headers)
+    return Response(content=gzip.decompress(compressed), media_type="text/html; charset=utf-8", headers=headers)
@@ -1,19 +1,34 @@
 # KorpBot/api/routes.py (ФИНАЛЬНАЯ ЧИСТАЯ ВЕРСИЯ)
 
+import csv
+import hashlib
+import io
 import json
 import logging
-from typing import List
+from datetime import datetime, timedelta
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
 
-from database.main import get_session
-from database.models import Poll, PollOption, User
+from config import MAX_POLL_DURATION_HOURS
+from database.main import async_read_session, get_read_session, get_session
+from database.models import Poll, PollOption, PollSnapshot, User
+from api.render_cache import (
+    FastJSONResponse,
+    report_cache,
+    make_etag,
+    is_not_modified,
+    not_modified_response,
+    compressed_html_response,
+)
+from poll_state import get_poll_tallies, set_poll_status, set_polls_status, start_new_poll, start_new_polls
+from poll_catalogue import poll_catalogue
+from vote_counters import vote_counts
 
 # --- Базовые настройки ---
 router = APIRouter()
@@ -33,93 +48,401 @@ class PollOut(BaseModel):
     id: int
     title: str
     status: bool
+    closes_at: Optional[datetime] = None
     options: List[OptionOut]
     model_config = ConfigDict(from_attributes=True)
 
 
+class PollIn(BaseModel):
+    title: str = Field(min_length=1, max_length=255)
+    options: List[str] = Field(min_length=2)
+    duration_minutes: Optional[int] = Field(None, ge=1, le=MAX_POLL_DURATION_HOURS * 60,
+                                            description="Через сколько минут опрос завершится сам")
+
+
+# Сколько опросов можно создать или переключить одним пакетным запросом
+MAX_BATCH_SIZE = 200
+
+
+class PollBatchIn(BaseModel):
+    polls: List[PollIn] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class PollStatusBatchIn(BaseModel):
+    poll_ids: List[int] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+    status: bool
+
+
+# Столбцы опроса, нужные страницам и JSON-ответам: строки вместо ORM-объектов
+POLL_COLUMNS = (Poll.id, Poll.title, Poll.status, Poll.closes_at, Poll.version)
+
+
+async def polls_out(session: AsyncSession, polls) -> list[dict]:
+    """
+    Опросы (строки POLL_COLUMNS) в формате PollOut за один проход, без ORM и Pydantic:
+    у завершенных варианты берутся из снимков, у остальных — одним запросом по столбцам.
+    Тело готово для FastJSONResponse; response_model у маршрутов остается только схемой OpenAPI.
+    """
+    snapshots = {}
+    closed_ids = [poll.id for poll in polls if not poll.status]
+    if closed_ids:
+        result = await session.execute(
+            select(PollSnapshot.poll_id, PollSnapshot.options).filter(PollSnapshot.poll_id.in_(closed_ids))
+        )
+        snapshots = dict(result.all())
+
+    options = {poll.id: [] for poll in polls if poll.id not in snapshots}
+    if options:
+        slot_votes = await vote_counts.option_votes(session, options)
+        result = await session.execute(
+            select(PollOption.poll_id, PollOption.id, PollOption.option_text, PollOption.votes_count)
+            .filter(PollOption.poll_id.in_(options)).order_by(PollOption.id)
+        )
+        for poll_id, option_id, option_text, votes_count in result:
+            options[poll_id].append({"id": option_id, "option_text": option_text,
+                                     "votes_count": (votes_count or 0) + slot_votes.get(option_id, 0)})
+
+    return [
+        {"id": poll.id, "title": poll.title, "status": poll.status, "closes_at": poll.closes_at,
+         "options": snapshots[poll.id] if poll.id in snapshots else options[poll.id]}
+        for poll in polls
+    ]
+
+
+async def polls_out_by_ids(session: AsyncSession, poll_ids: list[int]) -> list[dict]:
+    """polls_out для опросов по ID в порядке poll_ids (для ответов на создание)."""
+    result = await session.execute(select(*POLL_COLUMNS).filter(Poll.id.in_(poll_ids)))
+    rows = {row.id: row for row in result}
+    return await polls_out(session, [rows[poll_id] for poll_id in poll_ids])
+
+
+# --- Постраничная выборка опросов ---
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+async def fetch_polls_page(session: AsyncSession, limit: int, after: Optional[int] = None,
+                           status: Optional[bool] = None, created_from: Optional[datetime] = None,
+                           created_to: Optional[datetime] = None) -> tuple[list, Optional[int]]:
+    """
+    Возвращает страницу опросов (новые первыми) и курсор следующей страницы.
+    Курсор — ID последнего опроса на странице (keyset по Poll.id), поэтому
+    стоимость страницы не зависит ни от ее номера, ни от общего числа опросов.
+    """
+    query = select(*POLL_COLUMNS).order_by(Poll.id.desc()).limit(limit + 1)
+    if after is not None:
+        query = query.filter(Poll.id < after)
+    if status is not None:
+        query = query.filter(Poll.status == status)
+    if created_from is not None:
+        query = query.filter(Poll.created_at >= created_from)
+    if created_to is not None:
+        query = query.filter(Poll.created_at < created_to)
+
+    polls = (await session.execute(query)).all()
+    if len(polls) > limit:
+        polls = polls[:limit]
+        return polls, polls[-1].id
+    return polls, None
+
+
+def voters_page_query(poll_id: int, limit: int, after: Optional[int] = None, q: Optional[str] = None):
+    """Страница проголосовавших (keyset по User.id) с лишней строкой для курсора следующей страницы."""
+    query = (
+        select(User.id, User.user_tg_id, User.user_full_name, PollOption.option_text)
+        .join(PollOption, PollOption.id == User.option_id)
+        .filter(User.poll_id == poll_id)
+        .order_by(User.id)
+        .limit(limit + 1)
+    )
+    if after is not None:
+        query = query.filter(User.id > after)
+    if q:
+        # % и _ в строке поиска — обычные символы, а не шаблоны LIKE
+        pattern = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.filter(User.user_full_name.ilike(f"%{pattern}%", escape="\\"))
+    return query
+
+
 # --- Эндпоинты (маршруты) API ---
 
 @router.get("/", response_class=HTMLResponse, summary="Показать страницу со списком всех опросов")
-async def get_index_page(request: Request, session: AsyncSession = Depends(get_session)):
-    """Отдает HTML-страницу со списком всех опросов, ссылающихся на свои веб-отчеты."""
-    result = await session.execute(
-        select(Poll).order_by(Poll.id.desc())
-    )
-    all_polls = result.scalars().all()
-    return templates.TemplateResponse("index.html", {"request": request, "polls": all_polls})
+async def get_index_page(request: Request,
+                         limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                         after: Optional[int] = Query(None, description="ID последнего опроса предыдущей страницы"),
+                         status: Optional[bool] = None,
+                         created_from: Optional[datetime] = None,
+                         created_to: Optional[datetime] = None,
+                         session: AsyncSession = Depends(get_read_session)):
+    """Отдает HTML-страницу со списком опросов (постранично), ссылающихся на свои веб-отчеты."""
+    polls, next_cursor = await fetch_polls_page(session, limit, after, status, created_from, created_to)
+    next_url = str(request.url.include_query_params(after=next_cursor)) if next_cursor else None
+    first_url = str(request.url.remove_query_params("after")) if after is not None else None
+    return templates.TemplateResponse("index.html", {
+        "request": request,
+        "polls": polls,
+        "next_url": next_url,
+        "first_url": first_url,
+    })
 
 
 @router.get("/report/{poll_id}/view", response_class=HTMLResponse, summary="Посмотреть веб-отчет по опросу")
-async def get_web_report(request: Request, poll_id: int, session: AsyncSession = Depends(get_session)):
+async def get_web_report(request: Request, poll_id: int, session: AsyncSession = Depends(get_read_session)):
     """Генерирует и возвращает HTML-страницу с отчетом, графиком и списком проголосовавших."""
     logger.info(f"--- [ОТЧЕТ] Запрошен веб-отчет для опроса ID: {poll_id} ---")
 
-    # 1. Получаем опрос
-    poll_result = await session.execute(select(Poll).filter(Poll.id == poll_id))
-    poll = poll_result.scalar_one_or_none()
+    # 1. Получаем опрос вместе со снимком итогов (он есть только у завершенных опросов)
+    poll_result = await session.execute(
+        select(Poll, PollSnapshot).outerjoin(PollSnapshot, PollSnapshot.poll_id == Poll.id).filter(Poll.id == poll_id)
+    )
+    poll, snapshot = poll_result.one_or_none() or (None, None)
 
     if not poll:
         logger.warning(f"[ОТЧЕТ] Опрос с ID {poll_id} не найден.")
         raise HTTPException(status_code=404, detail=f"Опрос с ID {poll_id} не найден.")
     logger.info(f"[ОТЧЕТ] Найден опрос: '{poll.title}'")
 
-    # 2. Получаем участников с их выбором
-    participants_query = select(User).options(
-        selectinload(User.option)
-    ).filter(User.poll_id == poll_id)
-    participants_result = await session.execute(participants_query)
-    participants = participants_result.scalars().all()
-    logger.info(f"[ОТЧЕТ] Найдено участников в БД: {len(participants)}")
+    # Опрос не менялся: отвечаем 304 или отдаем готовый отчет из кэша рендера
+    version = (await vote_counts.versions(session, [poll]))[poll_id]
+    etag = make_etag("report", poll_id, version)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    cached = report_cache.get((poll_id, version))
+    if cached:
+        return compressed_html_response(request, cached, etag)
 
-    # 3. Получаем опции для построения графика
-    options_query = select(PollOption).filter(PollOption.poll_id == poll_id)
-    options_result = await session.execute(options_query)
-    options = options_result.scalars().all()
+    # 2. Итоги по вариантам: у завершенного опроса — из снимка, иначе одним
+    # агрегирующим запросом, без загрузки участников
+    if snapshot:
+        labels = [option["option_text"] for option in snapshot.options]
+        values = [option["votes_count"] for option in snapshot.options]
+    else:
+        tallies = await get_poll_tallies(session, poll_id)
+        labels = [row.option_text for row in tallies]
+        values = [row.votes for row in tallies]
 
     # --- Подготовка данных для передачи в HTML-шаблон ---
-    total_votes = len(participants)  # Самый надежный способ подсчета
+    total_votes = sum(values)
+    logger.info(f"[ОТЧЕТ] Всего голосов: {total_votes}")
 
-    chart_labels = json.dumps([opt.option_text for opt in options] if options else [])
-    chart_values = json.dumps([opt.votes_count for opt in options] if options else [])
+    chart_labels = json.dumps(labels)
+    chart_values = json.dumps(values)
 
+    # Список проголосовавших страница подгружает отдельно (см. get_report_voters)
     context = {
         "request": request,
         "poll": poll,
         "total_votes": total_votes,
         "labels": chart_labels,
         "values": chart_values,
-        "participants": participants  # Передаем список участников в шаблон
     }
 
-    return templates.TemplateResponse("report.html", context)
+    body = templates.get_template("report.html").render(context)
+    return compressed_html_response(request, report_cache.put((poll_id, version), body), etag)
+
+
+VOTERS_PAGE_SIZE = 100
+
+
+@router.get("/report/{poll_id}/voters", response_class=HTMLResponse, summary="Страница списка проголосовавших")
+async def get_report_voters(request: Request, poll_id: int,
+                            limit: int = Query(VOTERS_PAGE_SIZE, ge=1, le=500),
+                            after: Optional[int] = Query(None, description="ID последней записи предыдущей страницы"),
+                            q: Optional[str] = Query(None, max_length=100, description="Поиск по имени"),
+                            session: AsyncSession = Depends(get_read_session)):
+    """
+    Отдает HTML-фрагмент со страницей проголосовавших (строки таблицы).
+    report.html подгружает его по мере прокрутки, поэтому первичная отрисовка
+    отчета не зависит от числа участников.
+    """
+    query = voters_page_query(poll_id, limit, after, q)
+    voters = (await session.execute(query)).all()
+
+    next_cursor = None
+    if len(voters) > limit:
+        voters = voters[:limit]
+        next_cursor = voters[-1].id
+
+    # Курсор следующей страницы скрипт отчета берет из заголовка X-Next-Cursor
+    headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor else None
+    return templates.TemplateResponse("voters_fragment.html", {
+        "request": request,
+        "voters": voters,
+    }, headers=headers)
 
 
 # --- Эндпоинты для программного взаимодействия (если нужно) ---
 
-@router.get("/polls", response_model=List[PollOut], summary="Получить все опросы в JSON")
-async def get_all_polls_json(session: AsyncSession = Depends(get_session)):
-    """Возвращает JSON-список всех опросов с их опциями."""
-    result = await session.execute(
-        select(Poll).options(selectinload(Poll.options)).order_by(Poll.id.desc())
-    )
-    return result.scalars().all()
+@router.get("/polls", response_model=List[PollOut], summary="Получить опросы в JSON (постранично)")
+async def get_all_polls_json(request: Request,
+                             limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                             after: Optional[int] = Query(None, description="ID последнего опроса предыдущей страницы"),
+                             status: Optional[bool] = None,
+                             created_from: Optional[datetime] = None,
+                             created_to: Optional[datetime] = None,
+                             session: AsyncSession = Depends(get_read_session)):
+    """
+    Возвращает JSON-список опросов с их опциями, новые первыми.
+    Ссылка на следующую страницу отдается в заголовке Link (rel="next"),
+    а сам курсор — в заголовке X-Next-Cursor.
+    """
+    polls, next_cursor = await fetch_polls_page(session, limit, after, status, created_from, created_to)
+
+    # ETag страницы складывается из ID и версий попавших на нее опросов
+    versions = await vote_counts.versions(session, polls)
+    etag = make_etag("polls", hashlib.sha1(
+        repr([(poll.id, versions[poll.id]) for poll in polls] + [next_cursor]).encode()
+    ).hexdigest())
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+
+    # Варианты дочитываем только когда ответ действительно нужно отдавать
+    headers = {"ETag": etag}
+    if next_cursor:
+        next_url = request.url.include_query_params(after=next_cursor)
+        headers["Link"] = f'<{next_url}>; rel="next"'
+        headers["X-Next-Cursor"] = str(next_cursor)
+    return FastJSONResponse(await polls_out(session, polls), headers=headers)
 
 
 @router.get("/polls/{poll_id}", response_model=PollOut, summary="Получить конкретный опрос в JSON")
-async def get_poll_by_id_json(poll_id: int, session: AsyncSession = Depends(get_session)):
+async def get_poll_by_id_json(poll_id: int, request: Request,
+                              session: AsyncSession = Depends(get_read_session)):
     """Возвращает один опрос по его ID в формате JSON."""
-    poll = await session.get(Poll, poll_id, options=[selectinload(Poll.options)])
-    if not poll:
+    poll = (await session.execute(select(*POLL_COLUMNS).filter(Poll.id == poll_id))).one_or_none()
+    if poll is None:
+        raise HTTPException(status_code=404, detail="Опрос не найден.")
+    version = (await vote_counts.versions(session, [poll]))[poll_id]
+    etag = make_etag("poll", poll_id, version)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    return FastJSONResponse((await polls_out(session, [poll]))[0], headers={"ETag": etag})
+
+
+# --- Потоковая выгрузка проголосовавших ---
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_FIELDS = ["user_tg_id", "user_full_name", "option_text", "voted_at"]
+
+
+async def iter_voter_rows(poll_id: int):
+    """
+    Построчно отдает проголосовавших через серверный курсор (stream + yield_per),
+    поэтому память не зависит от числа голосов. Сессия открывается здесь же:
+    зависимость get_read_session закрывается раньше, чем ответ успевает отдаться.
+    """
+    query = (
+        select(User.user_tg_id, User.user_full_name, PollOption.option_text, User.voted_at)
+        .join(PollOption, PollOption.id == User.option_id)
+        .filter(User.poll_id == poll_id)
+        .order_by(User.id)
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+    async with async_read_session() as session:
+        result = await session.stream(query)
+        async for partition in result.partitions():
+            yield partition
+
+
+async def ensure_poll_exists(session: AsyncSession, poll_id: int):
+    if await session.get(Poll, poll_id) is None:
         raise HTTPException(status_code=404, detail="Опрос не найден.")
-    return poll
+
+
+@router.get("/polls/{poll_id}/voters.csv", summary="Выгрузить проголосовавших в CSV")
+async def export_voters_csv(poll_id: int, session: AsyncSession = Depends(get_read_session)):
+    """Потоково отдает CSV: user_tg_id, user_full_name, option_text, voted_at."""
+    await ensure_poll_exists(session, poll_id)
+
+    async def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # BOM, чтобы Excel сразу распознал кириллицу
+        buffer.write("\ufeff")
+        writer.writerow(EXPORT_FIELDS)
+        async for rows in iter_voter_rows(poll_id):
+            writer.writerows(
+                (row.user_tg_id, row.user_full_name or "", row.option_text,
+                 row.voted_at.isoformat() if row.voted_at else "")
+                for row in rows
+            )
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    return StreamingResponse(generate(), media_type="text/csv; charset=utf-8", headers={
+        "Content-Disposition": f'attachment; filename="poll_{poll_id}_voters.csv"',
+    })
+
+
+@router.get("/polls/{poll_id}/voters.ndjson", summary="Выгрузить проголосовавших в NDJSON")
+async def export_voters_ndjson(poll_id: int, session: AsyncSession = Depends(get_read_session)):
+    """Потоково отдает по одному JSON-объекту на строку для каждого проголосовавшего."""
+    await ensure_poll_exists(session, poll_id)
+
+    async def generate():
+        async for rows in iter_voter_rows(poll_id):
+            yield "".join(
+                json.dumps({
+                    "user_tg_id": row.user_tg_id,
+                    "user_full_name": row.user_full_name,
+                    "option_text": row.option_text,
+                    "voted_at": row.voted_at.isoformat() if row.voted_at else None,
+                }, ensure_ascii=False) + "\n"
+                for row in rows
+            )
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+def poll_in_values(payload: PollIn) -> tuple[str, list[str], Optional[datetime]]:
+    """(вопрос, варианты, срок) для start_new_poll(s); пустые варианты отбрасываются."""
+    options = [option.strip() for option in payload.options if option.strip()]
+    if len(options) < 2:
+        raise HTTPException(status_code=422, detail=f"Опрос «{payload.title}»: нужно как минимум 2 непустых варианта.")
+    closes_at = datetime.now() + timedelta(minutes=payload.duration_minutes) if payload.duration_minutes else None
+    return payload.title.strip(), options, closes_at
+
+
+@router.post("/polls", response_model=PollOut, status_code=201, summary="Создать опрос")
+async def create_poll(payload: PollIn, session: AsyncSession = Depends(get_session)):
+    """Создает опрос; с duration_minutes он завершится автоматически (см. poll_expiry.py)."""
+    poll_id = await start_new_poll(session, *poll_in_values(payload))
+    poll_catalogue.invalidate()
+    return FastJSONResponse((await polls_out_by_ids(session, [poll_id]))[0], status_code=201)
+
+
+@router.post("/polls:batch", response_model=List[PollOut], status_code=201, summary="Создать несколько опросов")
+async def create_polls_batch(payload: PollBatchIn, session: AsyncSession = Depends(get_session)):
+    """
+    Создает пачку опросов одной транзакцией (многострочные INSERT ... RETURNING):
+    либо создаются все, либо ни одного. Ответ — опросы в порядке запроса.
+    """
+    values = [poll_in_values(poll) for poll in payload.polls]
+    poll_ids = await start_new_polls(session, values)
+    poll_catalogue.invalidate()
+    return FastJSONResponse(await polls_out_by_ids(session, poll_ids), status_code=201)
+
+
+@router.put("/polls:status", summary="Изменить статус нескольких опросов")
+async def update_polls_status(payload: PollStatusBatchIn, session: AsyncSession = Depends(get_session)):
+    """Завершает или активирует набор опросов одним UPDATE; отсутствующие ID перечисляются в not_found."""
+    polls = await set_polls_status(session, payload.poll_ids, payload.status)
+    poll_catalogue.invalidate()
+    updated = {poll.id for poll in polls}
+    return {
+        "updated": sorted(updated),
+        "not_found": sorted(set(payload.poll_ids) - updated),
+        "status": payload.status,
+    }
 
 
 @router.put("/polls/{poll_id}/status", summary="Изменить статус опроса")
 async def update_poll_status(poll_id: int, status: bool, session: AsyncSession = Depends(get_session)):
-    """Изменяет статус опроса (активный/неактивный)."""
-    poll = await session.get(Poll, poll_id)
+    """Изменяет статус опроса (активный/неактивный); при завершении замораживает итоги в снимок."""
+    poll = await set_poll_status(session, poll_id, status)
     if not poll:
         raise HTTPException(status_code=404, detail="Опрос не найден.")
-    poll.status = status
-    await session.commit()
+    # В режиме вебхука бот живет в этом же процессе; иначе бот подхватит изменение по TTL каталога
+    poll_catalogue.invalidate()
     return {"message": f"Статус опроса {poll_id} изменен на {status}."}
\ No newline at end of file
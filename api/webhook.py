@@ -0,0 +1,51 @@
+# KorpBot/api/webhook.py
+
+import asyncio
+import hmac
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from fastapi import APIRouter, HTTPException, Request
+
+from config import WEBHOOK_SECRET
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Бот и диспетчер создаются при старте приложения (см. app.py)
+bot: Bot | None = None
+dp: Dispatcher | None = None
+
+# Ссылки на фоновые задачи обработки, чтобы их не собрал сборщик мусора
+_background_tasks: set[asyncio.Task] = set()
+
+
+async def _process_update(update: Update):
+    try:
+        await dp.feed_update(bot, update)
+    except Exception as e:
+        logger.error(f"Ошибка при обработке обновления {update.update_id}: {e}", exc_info=True)
+
+
+@router.post("/telegram/webhook", include_in_schema=False)
+async def telegram_webhook(request: Request):
+    """Принимает обновления от Telegram и передает их в общий Dispatcher бота."""
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(secret, WEBHOOK_SECRET):
+        raise HTTPException(status_code=403, detail="Неверный секретный токен.")
+    if bot is None or dp is None:
+        raise HTTPException(status_code=503, detail="Бот еще не инициализирован.")
+
+    update = Update.model_validate(await request.json(), context={"bot": bot})
+    # Отвечаем Telegram сразу, обработка идет в фоне
+    task = asyncio.create_task(_process_update(update))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return {"ok": True}
+
+
+async def drain():
+    """Дожидается обработки уже принятых обновлений."""
+    if _background_tasks:
+        await asyncio.gather(*_background_tasks, return_exceptions=True)
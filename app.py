@@ -1,16 +1,95 @@
 # KorpBot/app.py
 
+import logging
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response
 from api.routes import router as poll_router
+from api.live import change_feed, router as live_router
+from config import BOT_MODE, WEBHOOK_URL, WEBHOOK_SECRET
+from database.main import engine, read_engine
+from metrics import http_metrics_middleware, instrument_engine, render_metrics
+
+logger = logging.getLogger(__name__)
+
+
+async def start_webhook_bot():
+    """Поднимает бота внутри API-процесса и регистрирует вебхук в Telegram."""
+    from api import webhook
+    from bot_factory import create_bot, create_dispatcher
+    from leader_lock import start_background_tasks
+    from poll_cache_sync import poll_cache_sync
+    from vote_queue import vote_queue
+
+    webhook.bot = create_bot(os.getenv("BOT_TOKEN"))
+    webhook.dp = create_dispatcher()
+    vote_queue.start()
+    await poll_cache_sync.start()
+    # Бот поднимается в каждом воркере API, а рассылки, сроки опросов и сверка
+    # счетчиков — только в одном из них, держащем блокировку лидера (leader_lock.py)
+    await start_background_tasks(webhook.bot)
+    await webhook.bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET, drop_pending_updates=False)
+    logger.info(f"Вебхук бота установлен: {WEBHOOK_URL}")
+
+
+async def stop_webhook_bot():
+    """Дорабатывает принятые обновления и голоса, затем закрывает сессию бота."""
+    from api import webhook
+    from edit_scheduler import edit_scheduler
+    from leader_lock import stop_background_tasks
+    from poll_cache_sync import poll_cache_sync
+    from vote_queue import vote_queue
+
+    await webhook.drain()
+    await stop_background_tasks()
+    await poll_cache_sync.close()
+    await vote_queue.close()
+    await edit_scheduler.close()
+    await webhook.bot.session.close()
 
-app = FastAPI(title="PollBot API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Закрывает общие ресурсы API, а в режиме вебхука еще и поднимает бота."""
+    if BOT_MODE == "webhook":
+        await start_webhook_bot()
+    try:
+        yield
+    finally:
+        if BOT_MODE == "webhook":
+            await stop_webhook_bot()
+        await change_feed.close()
+
+
+if BOT_MODE == "webhook" and not (os.getenv("BOT_TOKEN") and WEBHOOK_URL and WEBHOOK_SECRET):
+    raise RuntimeError("Для BOT_MODE=webhook нужны BOT_TOKEN, WEBHOOK_URL и WEBHOOK_SECRET.")
+
+app = FastAPI(title="PollBot API", lifespan=lifespan)
+app.middleware("http")(http_metrics_middleware)
+instrument_engine(engine)
+if read_engine is not engine:
+    instrument_engine(read_engine, "replica")
 
 # Добавляем наш роутер с эндпоинтами
 app.include_router(poll_router, prefix="/api")
+app.include_router(live_router, prefix="/api")
+
+# Прием обновлений Telegram в режиме вебхука
+if BOT_MODE == "webhook":
+    from api.webhook import router as webhook_router
+    app.include_router(webhook_router)
 
 # --- НОВЫЙ РЕДИРЕКТ ---
 @app.get("/")
 def read_root():
     """Редирект с главной страницы на список опросов."""
-    return RedirectResponse(url="/api/")
\ No newline at end of file
+    return RedirectResponse(url="/api/")
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Метрики в формате Prometheus."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
\ No newline at end of file
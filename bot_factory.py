@@ -0,0 +1,45 @@
+# KorpBot/bot_factory.py
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+
+from commands import router as commands_router
+from general import router as general_router
+from config import (
+    FSM_STATE_TTL_SECONDS,
+    FSM_CACHE_TTL_SECONDS,
+    THROTTLE_VOTE_LIMIT,
+    THROTTLE_RESULTS_LIMIT,
+    THROTTLE_WINDOW_SECONDS,
+)
+from database.fsm_storage import SQLAlchemyStorage
+from database.main import async_session
+from metrics import BotMetricsMiddleware
+from throttling import ThrottlingMiddleware
+
+
+def create_bot(token: str) -> Bot:
+    """Создает экземпляр бота с настройками по умолчанию."""
+    return Bot(token=token, default=DefaultBotProperties(parse_mode="HTML"))
+
+
+def create_dispatcher() -> Dispatcher:
+    """
+    Собирает Dispatcher со всеми роутерами бота.
+    Используется и в режиме long polling (main.py), и в режиме вебхука (app.py).
+    """
+    # Состояния FSM хранятся в общей БД, поэтому реплики бота взаимозаменяемы
+    storage = SQLAlchemyStorage(async_session, ttl_seconds=FSM_STATE_TTL_SECONDS,
+                                cache_ttl_seconds=FSM_CACHE_TTL_SECONDS)
+    dp = Dispatcher(storage=storage)
+    # Outer-middleware срабатывает до фильтров: лишние нажатия не доходят даже до поиска хэндлера
+    dp.callback_query.outer_middleware(ThrottlingMiddleware(
+        {"vote": THROTTLE_VOTE_LIMIT, "results": THROTTLE_RESULTS_LIMIT},
+        window_seconds=THROTTLE_WINDOW_SECONDS,
+    ))
+    # Inner-middleware диспетчера действует и на хэндлеры вложенных роутеров
+    dp.message.middleware(BotMetricsMiddleware())
+    dp.callback_query.middleware(BotMetricsMiddleware())
+    dp.include_router(commands_router)
+    dp.include_router(general_router)
+    return dp
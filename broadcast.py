@@ -0,0 +1,285 @@
+# KorpBot/broadcast.py
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.types import Message
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from sqlalchemy import func, select, text, union, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import BROADCAST_RATE_PER_SECOND, BROADCAST_CHUNK_SIZE
+from database.main import async_session, engine
+from database.models import BotSubscriber, Broadcast, Poll, User
+from edit_scheduler import edit_scheduler
+from poll_state import remember_poll_messages
+
+logger = logging.getLogger(__name__)
+
+# Сколько раз повторять отправку одному адресату после RetryAfter
+MAX_SEND_ATTEMPTS = 3
+
+
+class TokenBucket:
+    """
+    Ведро токенов: не больше rate отправок в секунду с всплеском до capacity.
+    pause() останавливает все отправки, когда Telegram ответил RetryAfter:
+    этот лимит действует на бота целиком, а не на один чат.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        # Очередь ожидающих обслуживается по порядку
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+async def remember_subscriber(session: AsyncSession, user_tg_id: int) -> None:
+    """Запоминает пользователя, отправившего /start, как адресата будущих рассылок."""
+    statement = insert(BotSubscriber).values(user_tg_id=user_tg_id, first_seen_at=datetime.now())
+    await session.execute(statement.on_conflict_do_nothing(index_elements=[BotSubscriber.user_tg_id]))
+    await session.commit()
+
+
+def recipients_query():
+    """Все известные боту пользователи: проголосовавшие хотя бы раз и отправившие /start."""
+    recipients = union(select(User.user_tg_id), select(BotSubscriber.user_tg_id)).subquery()
+    return recipients.c.user_tg_id, select(recipients.c.user_tg_id)
+
+
+def recipients_page(after: int, limit: int):
+    """
+    Следующие limit адресатов после user_tg_id = after (keyset). Каждый источник читается
+    своей страницей по индексу user_tg_id, а объединяются только две страницы:
+    первые limit общих адресатов всегда входят в первые limit своего источника.
+    """
+    voters = (
+        select(User.user_tg_id).distinct().filter(User.user_tg_id > after)
+        .order_by(User.user_tg_id).limit(limit)
+    ).subquery()
+    subscribers = (
+        select(BotSubscriber.user_tg_id).filter(BotSubscriber.user_tg_id > after)
+        .order_by(BotSubscriber.user_tg_id).limit(limit)
+    ).subquery()
+    recipients = union(select(voters.c.user_tg_id), select(subscribers.c.user_tg_id)).subquery()
+    return select(recipients.c.user_tg_id).order_by(recipients.c.user_tg_id).limit(limit)
+
+
+@asynccontextmanager
+async def claim_broadcast(broadcast_id: int):
+    """
+    Захват рассылки процессом: True, если рассылку ведет этот процесс, False — если другой.
+    Захват — сессионная advisory-блокировка Postgres на отдельном соединении, которое
+    закрывается по окончании; упавший процесс отпускает рассылку вместе с соединением.
+    Без Postgres процесс один, и захватывать нечего.
+    """
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+    connection = await engine.connect()
+    try:
+        claimed = (await connection.execute(
+            text("SELECT pg_try_advisory_lock(hashtext('korpbot_broadcast'), :broadcast_id)"),
+            {"broadcast_id": broadcast_id},
+        )).scalar()
+        await connection.commit()
+        yield claimed
+    finally:
+        # Соединение не возвращается в пул: вместе с ним снимается и блокировка
+        await connection.invalidate()
+
+
+def progress_text(broadcast: Broadcast, started: float, sent_since_start: int) -> str:
+    done = broadcast.sent + broadcast.failed
+    elapsed = max(time.monotonic() - started, 1e-6)
+    speed = sent_since_start / elapsed
+    lines = [
+        f"📣 <b>Рассылка опроса ID {broadcast.poll_id}</b>",
+        f"Обработано: {done} из {broadcast.total}",
+        f"✅ Доставлено: {broadcast.sent}   ⚠️ Не доставлено: {broadcast.failed}",
+    ]
+    if broadcast.status == "done":
+        lines.append("🏁 Рассылка завершена.")
+    elif broadcast.status == "stopped":
+        lines.append("🛑 Рассылка остановлена: опрос завершен.")
+    elif speed > 0:
+        lines.append(f"Скорость: {speed:.1f} сообщ./с, осталось ~{int((broadcast.total - done) / speed)} с")
+    return "\n".join(lines)
+
+
+class Broadcaster:
+    """
+    Рассылка нового опроса всем известным пользователям.
+    Адресаты читаются пачками по возрастанию user_tg_id (keyset), отправка идет через общее
+    ведро токенов (глобальный лимит Telegram ~30 сообщений в секунду). Каждый адресат
+    получает одно сообщение, поэтому лимит на чат касается только сообщения
+    с прогрессом у администратора — его правки идут через edit_scheduler.
+    После каждой пачки прогресс сохраняется в БД: после перезапуска рассылка
+    продолжается с места остановки, повторно получить опрос может не больше одной пачки.
+    Рассылку ведет один процесс (claim_broadcast), а завершение опроса ее останавливает.
+    """
+
+    def __init__(self, rate_per_second: float = 25, chunk_size: int = 500):
+        self.bucket = TokenBucket(rate_per_second)
+        self.chunk_size = chunk_size
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    async def start(self, bot: Bot, poll_id: int, admin_chat_id: int) -> int:
+        """Создает рассылку опроса и запускает ее в фоне. Возвращает ID рассылки."""
+        column, query = recipients_query()
+        async with async_session() as session:
+            total = await session.scalar(select(func.count()).select_from(query.subquery()))
+            broadcast = Broadcast(poll_id=poll_id, admin_chat_id=admin_chat_id, total=total)
+            session.add(broadcast)
+            await session.commit()
+
+        progress = await bot.send_message(admin_chat_id, progress_text(broadcast, time.monotonic(), 0),
+                                          parse_mode="HTML")
+        async with async_session() as session:
+            await session.execute(
+                update(Broadcast).where(Broadcast.id == broadcast.id).values(progress_message_id=progress.message_id)
+            )
+            await session.commit()
+        self._launch(bot, broadcast.id)
+        return broadcast.id
+
+    async def resume(self, bot: Bot) -> None:
+        """Продолжает рассылки, прерванные остановкой процесса."""
+        async with async_session() as session:
+            result = await session.execute(select(Broadcast.id).filter_by(status="running"))
+            broadcast_ids = result.scalars().all()
+        for broadcast_id in broadcast_ids:
+            logger.info(f"Продолжаем рассылку {broadcast_id} после перезапуска.")
+            self._launch(bot, broadcast_id)
+
+    async def close(self) -> None:
+        """Останавливает рассылки; прогресс уже сохранен, resume() продолжит их."""
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    def _launch(self, bot: Bot, broadcast_id: int) -> None:
+        if broadcast_id not in self._tasks:
+            task = asyncio.create_task(self._run(bot, broadcast_id))
+            self._tasks[broadcast_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+
+    async def _run(self, bot: Bot, broadcast_id: int) -> None:
+        async with claim_broadcast(broadcast_id) as claimed:
+            if not claimed:
+                logger.info(f"Рассылку {broadcast_id} уже ведет другой процесс.")
+                return
+            await self._send_chunks(bot, broadcast_id)
+
+    async def _send_chunks(self, bot: Bot, broadcast_id: int) -> None:
+        # Импорт здесь: commands.py сам импортирует этот модуль
+        from commands import get_poll_text_and_options
+        from poll_catalogue import poll_catalogue
+
+        started = time.monotonic()
+        sent_since_start = 0
+        try:
+            while True:
+                async with async_session() as session:
+                    broadcast = await session.get(Broadcast, broadcast_id)
+                    if broadcast is None or broadcast.status != "running":
+                        # Опрос удален вместе с рассылкой или ее уже закончил другой процесс
+                        return
+                    chunk = []
+                    if await session.scalar(select(Poll.status).filter_by(id=broadcast.poll_id)):
+                        poll_text, options = await get_poll_text_and_options(broadcast.poll_id, session)
+                        if not options:
+                            return
+                        result = await session.execute(recipients_page(broadcast.last_user_tg_id, self.chunk_size))
+                        chunk = result.scalars().all()
+                    else:
+                        # Опрос завершен: оставшимся адресатам голосовать уже не за что
+                        broadcast.status = "stopped"
+                        broadcast.finished_at = datetime.now()
+
+                # Соединение с БД не держим, пока пачка уходит в Telegram
+                if chunk:
+                    keyboard = poll_catalogue.voting_keyboard(broadcast.poll_id, options)
+                    outcomes = await asyncio.gather(*(
+                        self._send(bot, user_tg_id, f"🆕 Новый опрос!\n\n{poll_text}", keyboard)
+                        for user_tg_id in chunk
+                    ))
+                    delivered = sum(1 for sent in outcomes if sent)
+                    sent_since_start += delivered
+                    broadcast.sent += delivered
+                    broadcast.failed += len(chunk) - delivered
+                    broadcast.last_user_tg_id = chunk[-1]
+                if broadcast.status == "running" and len(chunk) < self.chunk_size:
+                    broadcast.status = "done"
+                    broadcast.finished_at = datetime.now()
+
+                async with async_session() as session:
+                    if chunk:
+                        await remember_poll_messages(session, broadcast.poll_id, [
+                            (sent.chat.id, sent.message_id) for sent in outcomes if sent
+                        ])
+                    await session.execute(update(Broadcast).where(Broadcast.id == broadcast_id).values(
+                        sent=broadcast.sent, failed=broadcast.failed, last_user_tg_id=broadcast.last_user_tg_id,
+                        status=broadcast.status, finished_at=broadcast.finished_at,
+                    ))
+                    await session.commit()
+
+                if broadcast.progress_message_id:
+                    edit_scheduler.schedule(bot, broadcast.admin_chat_id, broadcast.progress_message_id,
+                                            progress_text(broadcast, started, sent_since_start))
+                if broadcast.status != "running":
+                    logger.info(f"Рассылка {broadcast_id} {'завершена' if broadcast.status == 'done' else 'остановлена'}: "
+                                f"{broadcast.sent} доставлено, {broadcast.failed} не доставлено.")
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Рассылка остается в статусе running и продолжится после перезапуска
+            logger.error(f"Рассылка {broadcast_id} прервана: {e}")
+
+    async def _send(self, bot: Bot, user_tg_id: int, text: str, keyboard) -> Message | None:
+        """Отправляет опрос адресату; возвращает сообщение или None, если доставить не удалось."""
+        for _ in range(MAX_SEND_ATTEMPTS):
+            await self.bucket.acquire()
+            try:
+                return await bot.send_message(user_tg_id, text, reply_markup=keyboard, parse_mode="HTML")
+            except TelegramRetryAfter as e:
+                logger.warning(f"Telegram просит подождать {e.retry_after} с. во время рассылки")
+                self.bucket.pause(e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest):
+                # Пользователь заблокировал бота или чат недоступен
+                return None
+            except Exception as e:
+                logger.warning(f"Не удалось отправить опрос пользователю {user_tg_id}: {e}")
+                return None
+        return None
+
+
+broadcaster = Broadcaster(rate_per_second=BROADCAST_RATE_PER_SECOND, chunk_size=BROADCAST_CHUNK_SIZE)
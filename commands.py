@@ -1,6 +1,8 @@
 # KorpBot/commands.py (ПОЛНАЯ ВЕРСИЯ С ПРОВЕРКОЙ ПРАВ)
 
 import logging
+import math
+from datetime import datetime, timedelta
 from aiogram import types, Router, F
 from aiogram.filters import Command, StateFilter, CommandObject
 from aiogram.fsm.context import FSMContext
@@ -10,48 +12,92 @@ from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 from keyboards import create_delete_confirm_keyboard
 
-from database.main import async_session
-from database.models import Poll, PollOption, User
-from poll_state import start_new_poll, record_vote
+from database.main import async_session, mark_written, read_session
+from database.models import Poll, PollOption, PollSnapshot, User
+from poll_state import (start_new_poll, set_poll_status, render_poll_text, snapshot_options, remember_poll_messages,
+                        notify_poll_changed)
+from poll_cache import poll_cache
+from poll_catalogue import poll_catalogue
+from vote_counters import vote_counts
+from vote_queue import vote_queue
+from edit_scheduler import edit_scheduler
+from broadcast import broadcaster, remember_subscriber
+from poll_expiry import poll_expiry
 from keyboards import (
     get_main_menu,
-    create_poll_choice_keyboard,
-    create_admin_poll_keyboard,
-    create_voting_keyboard,
+    create_admin_console_keyboard,
+    create_admin_poll_card_keyboard,
     create_results_keyboard
 )
-from config import is_admin  # <-- ИМПОРТИРУЕМ ФУНКЦИЮ ПРОВЕРКИ
+from config import is_admin, BROADCAST_NEW_POLLS, ADMIN_CONSOLE_PAGE_SIZE, MAX_POLL_DURATION_HOURS  # <-- ИМПОРТИРУЕМ ФУНКЦИЮ ПРОВЕРКИ
 
 # Настройка логгера
 logger = logging.getLogger(__name__)
 router = Router()
 
 
-# --- Вспомогательная функция (без изменений) ---
+# --- Вспомогательные функции ---
 async def get_poll_text_and_options(poll_id: int, session: AsyncSession) -> tuple[str, list[PollOption] | None]:
-    # ... (код этой функции остается прежним)
+    """Возвращает текст с результатами и варианты опроса; без изменений опроса — из кэша."""
+    cached = poll_cache.get(poll_id)
+    if cached:
+        return cached
+    # Версия снимается до чтения: голос, записанный во время чтения, не попадет в кэш устаревшим
+    version = poll_cache.version(poll_id)
+    # Завершенный опрос целиком лежит в снимке: один поиск по первичному ключу
+    snapshot = await session.get(PollSnapshot, poll_id)
+    if snapshot:
+        options = snapshot_options(snapshot)
+        poll_cache.put(poll_id, version, snapshot.telegram_text, options)
+        return snapshot.telegram_text, options
     query = select(Poll).options(selectinload(Poll.options)).filter(Poll.id == poll_id)
     poll = (await session.execute(query)).scalar_one_or_none()
     if not poll: return "Опрос не найден.", None
-    total_votes = sum(opt.votes_count for opt in poll.options)
-    text_lines = [f"<b>{poll.title}</b>\n", f"👥 Всего проголосовало: {total_votes}\n"]
     sorted_options = sorted(poll.options, key=lambda o: o.id)
-    for option in sorted_options:
-        percentage = (option.votes_count / total_votes * 100) if total_votes > 0 else 0
-        text_lines.append(f"▫️ {option.option_text}: {option.votes_count} ({percentage:.1f}%)")
-    return "\n".join(text_lines), sorted_options
+    await vote_counts.apply(session, sorted_options)
+    poll_text = render_poll_text(poll.title, sorted_options)
+    poll_cache.put(poll_id, version, poll_text, sorted_options)
+    return poll_text, sorted_options
+
+
+def render_admin_poll_card(poll: Poll) -> str:
+    status_emoji = "🟢 Активен" if poll.status else "🔴 Завершен"
+    return f"<b>ID: {poll.id}</b> - {poll.title}\n<i>Статус: {status_emoji}</i>"
+
+
+async def get_admin_console_page(offset: int) -> tuple[str, types.InlineKeyboardMarkup | None]:
+    """Страница админ-консоли одним запросом: лишняя строка в LIMIT говорит, есть ли следующая."""
+    async with async_session() as session:
+        result = await session.execute(
+            select(Poll.id, Poll.title, Poll.status)
+            .order_by(Poll.created_at.desc(), Poll.id.desc())
+            .offset(offset).limit(ADMIN_CONSOLE_PAGE_SIZE + 1)
+        )
+        polls = result.all()
+    if not polls:
+        return "В базе данных еще нет ни одного опроса.", None
+
+    has_next = len(polls) > ADMIN_CONSOLE_PAGE_SIZE
+    polls = polls[:ADMIN_CONSOLE_PAGE_SIZE]
+    page = offset // ADMIN_CONSOLE_PAGE_SIZE + 1
+    text = (f"<b>Список всех опросов для управления</b> (стр. {page}):\n\n"
+            "Выберите опрос, чтобы изменить статус, открыть отчет или удалить его.")
+    return text, create_admin_console_keyboard(polls, offset, ADMIN_CONSOLE_PAGE_SIZE, has_next)
 
 
 # --- Состояния для FSM ---
 class PollCreation(StatesGroup):
     waiting_for_question = State()
     waiting_for_options = State()
+    waiting_for_duration = State()
 
 
 # --- Пользовательские команды (без изменений) ---
 @router.message(Command("start"))
 async def start(message: types.Message):
-    # ... (код без изменений)
+    # Запомнившие бота через /start тоже получают рассылки новых опросов
+    async with async_session() as session:
+        await remember_subscriber(session, message.from_user.id)
     await message.answer(
         f"Здравствуйте, {message.from_user.first_name}! 👋\n\n"
         "Я корпоративный бот для проведения голосований.",
@@ -96,14 +142,12 @@ async def site(message: types.Message):
 
 @router.message(Command("poll"))
 async def list_active_polls(message: types.Message):
-    # ... (код без изменений)
-    async with async_session() as session:
-        result = await session.execute(select(Poll).filter_by(status=True).order_by(Poll.created_at.desc()))
-        active_polls = result.scalars().all()
-    if not active_polls:
+    # Клавиатура собирается из каталога активных опросов, а не из БД на каждый вызов
+    keyboard = await poll_catalogue.choice_keyboard()
+    if keyboard is None:
         await message.answer("На данный момент активных опросов нет. 😴")
         return
-    await message.answer("Выберите опрос для участия:", reply_markup=create_poll_choice_keyboard(active_polls))
+    await message.answer("Выберите опрос для участия:", reply_markup=keyboard)
 
 
 # --- Команды для создания опроса (FSM) с проверкой прав ---
@@ -131,12 +175,38 @@ async def newpoll_get_options(message: types.Message, state: FSMContext):
     if len(options) < 2:
         await message.answer("Нужно как минимум 2 варианта. Попробуйте еще раз.")
         return
+    await state.update_data(options=options)
+    await message.answer("Сколько часов будет идти опрос? Отправьте число (например, 24 или 1.5) "
+                         "или 0, чтобы завершить его вручную.")
+    await state.set_state(PollCreation.waiting_for_duration)
+
+
+@router.message(StateFilter(PollCreation.waiting_for_duration))
+async def newpoll_get_duration(message: types.Message, state: FSMContext):
+    try:
+        hours = float(message.text.replace(",", "."))
+    except ValueError:
+        hours = -1
+    # float() принимает и "inf"/"nan", а слишком большой срок не поместится в datetime
+    if not math.isfinite(hours) or hours < 0 or hours > MAX_POLL_DURATION_HOURS:
+        await message.answer("Нужно неотрицательное число часов. Попробуйте еще раз.")
+        return
+    closes_at = datetime.now() + timedelta(hours=hours) if hours > 0 else None
+
     data = await state.get_data()
     question = data.get("question")
     async with async_session() as session:
-        poll_id = await start_new_poll(session, question, options)
-    await message.answer(f"✅ Опрос \"{question}\" успешно создан с ID {poll_id}.")
+        poll_id = await start_new_poll(session, question, data.get("options"), closes_at)
+    poll_catalogue.invalidate()
+    if closes_at:
+        poll_expiry.schedule(poll_id, closes_at)
+        await message.answer(f"✅ Опрос \"{question}\" успешно создан с ID {poll_id}. "
+                             f"Он завершится {closes_at:%d.%m.%Y %H:%M}.")
+    else:
+        await message.answer(f"✅ Опрос \"{question}\" успешно создан с ID {poll_id}.")
     await state.clear()
+    if BROADCAST_NEW_POLLS:
+        await broadcaster.start(message.bot, poll_id, message.chat.id)
 
 
 # --- Обработка инлайн-кнопок и "живых" опросов (без изменений) ---
@@ -144,13 +214,20 @@ async def newpoll_get_options(message: types.Message, state: FSMContext):
 async def send_custom_poll(callback: types.CallbackQuery):
     # ... (код без изменений)
     poll_id = int(callback.data.split("_")[1])
-    async with async_session() as session:
+    async with read_session(poll_id) as session:
         poll_text, options = await get_poll_text_and_options(poll_id, session)
     if not options:
+        # Опрос удален в другом процессе, а каталог еще предлагает его: перечитываем
+        poll_catalogue.invalidate()
         await callback.answer(poll_text, show_alert=True)
         return
-    await callback.message.answer(text=poll_text, reply_markup=create_voting_keyboard(options), parse_mode="HTML")
+    sent = await callback.message.answer(text=poll_text,
+                                         reply_markup=poll_catalogue.voting_keyboard(poll_id, options),
+                                         parse_mode="HTML")
     await callback.answer()
+    # По завершении опроса это сообщение заменится итогами
+    async with async_session() as session:
+        await remember_poll_messages(session, poll_id, [(sent.chat.id, sent.message_id)])
 
 
 @router.callback_query(F.data.startswith("vote_"))
@@ -159,43 +236,42 @@ async def handle_vote(callback: types.CallbackQuery):
     option_id = int(callback.data.split("_")[1])
     user_id = callback.from_user.id
     user_full_name = callback.from_user.full_name
-    async with async_session() as session:
-        option = await session.get(PollOption, option_id)
-        if not option:
-            await callback.answer("Этот вариант ответа больше не существует.", show_alert=True)
-            return
-        poll_id = option.poll_id
-        await record_vote(session, poll_id, option_id, user_id, user_full_name)
-        new_text, _ = await get_poll_text_and_options(poll_id, session)
+    # Голос уходит в очередь и пишется в БД пачкой, а пользователю отвечаем сразу
+    vote_saved = vote_queue.submit(option_id, user_id, user_full_name)
+    await callback.answer("Ваш голос учтен!")
     try:
-        await callback.message.edit_text(text=new_text, reply_markup=create_results_keyboard(poll_id),
-                                         parse_mode="HTML")
-        await callback.answer("Ваш голос учтен!")
+        poll_id = await vote_saved
     except Exception as e:
-        logger.warning(f"Не удалось отредактировать сообщение: {e}")
-        await callback.answer("Ваш голос учтен!")
+        logger.error(f"Не удалось сохранить голос: {e}")
+        return
+    if poll_id is None:
+        await callback.message.answer("Опрос уже завершен или этого варианта ответа больше нет.")
+        return
+    # Запись голоса отметила опрос в read_session, поэтому итоги читаются с основной БД
+    async with read_session(poll_id) as session:
+        new_text, _ = await get_poll_text_and_options(poll_id, session)
+    # Правки одного сообщения от множества голосов схлопываются планировщиком
+    edit_scheduler.schedule(callback.bot, callback.message.chat.id, callback.message.message_id,
+                            new_text, create_results_keyboard(poll_id))
 
 
 @router.callback_query(F.data.startswith("results_"))
 async def refresh_results(callback: types.CallbackQuery):
     # ... (код без изменений)
     poll_id = int(callback.data.split("_")[1])
-    async with async_session() as session:
+    async with read_session(poll_id) as session:
         new_text, options = await get_poll_text_and_options(poll_id, session)
     if not options:
         await callback.answer("Опрос не найден.", show_alert=True)
         return
-    try:
-        async with async_session() as session:
-            user_vote_check = await session.execute(
-                select(User).filter_by(poll_id=poll_id, user_tg_id=callback.from_user.id))
-            voted = user_vote_check.scalar_one_or_none() is not None
-        keyboard = create_results_keyboard(poll_id) if voted else create_voting_keyboard(options)
-        await callback.message.edit_text(text=new_text, reply_markup=keyboard, parse_mode="HTML")
-        await callback.answer("Результаты обновлены.")
-    except Exception as e:
-        logger.warning(f"Не удалось обновить результаты: {e}")
-        await callback.answer("Результаты уже актуальны.")
+    async with read_session(poll_id) as session:
+        user_vote_check = await session.execute(
+            select(User).filter_by(poll_id=poll_id, user_tg_id=callback.from_user.id))
+        voted = user_vote_check.scalar_one_or_none() is not None
+    keyboard = create_results_keyboard(poll_id) if voted else poll_catalogue.voting_keyboard(poll_id, options)
+    edit_scheduler.schedule(callback.bot, callback.message.chat.id, callback.message.message_id,
+                            new_text, keyboard)
+    await callback.answer("Результаты обновлены.")
 
 
 # --- Команды и колбэки администратора с проверкой прав ---
@@ -204,19 +280,39 @@ async def list_all_polls_admin(message: types.Message):
     if not is_admin(message.from_user.id):
         return await message.answer("⛔️ Эта команда доступна только администратору.")
 
-    async with async_session() as session:
-        result = await session.execute(select(Poll).order_by(Poll.created_at.desc()))
-        all_polls = result.scalars().all()
+    # Одно сообщение-консоль со страницей опросов вместо сообщения на каждый опрос
+    text, keyboard = await get_admin_console_page(0)
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
 
-    if not all_polls:
-        await message.answer("В базе данных еще нет ни одного опроса.")
-        return
 
-    await message.answer("<b>Список всех опросов для управления:</b>", parse_mode="HTML")
-    for poll in all_polls:
-        status_emoji = "🟢 Активен" if poll.status else "🔴 Завершен"
-        poll_text = f"<b>ID: {poll.id}</b> - {poll.title}\n<i>Статус: {status_emoji}</i>"
-        await message.answer(poll_text, reply_markup=create_admin_poll_keyboard(poll), parse_mode="HTML")
+@router.callback_query(F.data.startswith("admin_list_"))
+async def show_admin_console_page(callback: types.CallbackQuery):
+    """Листает страницы админ-консоли в том же сообщении."""
+    if not is_admin(callback.from_user.id):
+        return await callback.answer("Доступ запрещен.", show_alert=True)
+
+    offset = int(callback.data.split("_")[2])
+    text, keyboard = await get_admin_console_page(offset)
+    await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("admin_card_"))
+async def show_admin_poll_card(callback: types.CallbackQuery):
+    """Показывает в консоли карточку опроса с действиями над ним."""
+    if not is_admin(callback.from_user.id):
+        return await callback.answer("Доступ запрещен.", show_alert=True)
+
+    parts = callback.data.split("_")
+    poll_id, offset = int(parts[2]), int(parts[3])
+    async with async_session() as session:
+        poll = await session.get(Poll, poll_id)
+    if not poll:
+        return await callback.answer("Опрос не найден.", show_alert=True)
+
+    await callback.message.edit_text(render_admin_poll_card(poll),
+                                     reply_markup=create_admin_poll_card_keyboard(poll, offset), parse_mode="HTML")
+    await callback.answer()
 
 
 @router.callback_query(F.data.startswith("admin_poll_"))
@@ -229,18 +325,16 @@ async def manage_poll_status(callback: types.CallbackQuery):
     poll_id = int(parts[3])
 
     async with async_session() as session:
-        poll_to_update = await session.get(Poll, poll_id)
-        if not poll_to_update:
-            return await callback.answer("Опрос не найден.", show_alert=True)
-
-        poll_to_update.status = (action == "activate")
-        await session.commit()
-        await callback.answer(f"Опрос {'активирован' if poll_to_update.status else 'завершен'}.")
+        # При завершении итоги замораживаются в снимок, при активации снимок сбрасывается
+        poll_to_update = await set_poll_status(session, poll_id, action == "activate")
+    if not poll_to_update:
+        return await callback.answer("Опрос не найден.", show_alert=True)
+    poll_catalogue.invalidate()
+    await callback.answer(f"Опрос {'активирован' if poll_to_update.status else 'завершен'}.")
 
-        status_emoji = "🟢 Активен" if poll_to_update.status else "🔴 Завершен"
-        poll_text = f"<b>ID: {poll_to_update.id}</b> - {poll_to_update.title}\n<i>Статус: {status_emoji}</i>"
-        await callback.message.edit_text(poll_text, reply_markup=create_admin_poll_keyboard(poll_to_update),
-                                         parse_mode="HTML")
+    await callback.message.edit_text(render_admin_poll_card(poll_to_update),
+                                     reply_markup=create_admin_poll_card_keyboard(poll_to_update),
+                                     parse_mode="HTML")
 
 
 @router.callback_query(F.data.startswith("admin_report_"))
@@ -253,55 +347,63 @@ async def send_web_report_link(callback: types.CallbackQuery):
     await callback.message.answer(f"Ссылка на веб-отчет по опросу ID {poll_id}:\n{report_url}")
     await callback.answer()
 
-    @router.callback_query(F.data.startswith("admin_delete_ask_"))
-    async def ask_delete_poll(callback: types.CallbackQuery):
-        """Спрашивает подтверждение перед удалением опроса."""
-        if not is_admin(callback.from_user.id):
-            return await callback.answer("Доступ запрещен.", show_alert=True)
-
-        poll_id = int(callback.data.split("_")[3])
-        await callback.message.edit_text(
-            f"Вы уверены, что хотите удалить опрос ID {poll_id}?\n"
-            "<b>Это действие необратимо и удалит всю связанную статистику!</b>",
-            reply_markup=create_delete_confirm_keyboard(poll_id),
-            parse_mode="HTML"
-        )
-        await callback.answer()
-
-    @router.callback_query(F.data.startswith("admin_delete_confirm_"))
-    async def confirm_delete_poll(callback: types.CallbackQuery):
-        """Окончательно удаляет опрос из базы данных."""
-        if not is_admin(callback.from_user.id):
-            return await callback.answer("Доступ запрещен.", show_alert=True)
-
-        poll_id = int(callback.data.split("_")[3])
-        async with async_session() as session:
-            poll_to_delete = await session.get(Poll, poll_id)
-            if poll_to_delete:
-                await session.delete(poll_to_delete)
-                await session.commit()
-                await callback.message.edit_text(f"✅ Опрос ID {poll_id} был успешно удален.")
-            else:
-                await callback.message.edit_text(f"⚠️ Опрос ID {poll_id} уже был удален ранее.")
-
-        await callback.answer()
-
-    @router.callback_query(F.data.startswith("admin_delete_cancel_"))
-    async def cancel_delete_poll(callback: types.CallbackQuery):
-        """Отменяет процесс удаления и возвращает к карточке опроса."""
-        if not is_admin(callback.from_user.id):
-            return await callback.answer("Доступ запрещен.", show_alert=True)
-
-        poll_id = int(callback.data.split("_")[3])
-        async with async_session() as session:
-            poll = await session.get(Poll, poll_id)
-            if not poll:
-                await callback.message.edit_text("Опрос был удален.")
-                return
-
-            status_emoji = "🟢 Активен" if poll.status else "🔴 Завершен"
-            poll_text = f"<b>ID: {poll.id}</b> - {poll.title}\n<i>Статус: {status_emoji}</i>"
-            await callback.message.edit_text(poll_text, reply_markup=create_admin_poll_keyboard(poll),
-                                             parse_mode="HTML")
-
-        await callback.answer("Удаление отменено.")
\ No newline at end of file
+
+@router.callback_query(F.data.startswith("admin_delete_ask_"))
+async def ask_delete_poll(callback: types.CallbackQuery):
+    """Спрашивает подтверждение перед удалением опроса."""
+    if not is_admin(callback.from_user.id):
+        return await callback.answer("Доступ запрещен.", show_alert=True)
+
+    poll_id = int(callback.data.split("_")[3])
+    await callback.message.edit_text(
+        f"Вы уверены, что хотите удалить опрос ID {poll_id}?\n"
+        "<b>Это действие необратимо и удалит всю связанную статистику!</b>",
+        reply_markup=create_delete_confirm_keyboard(poll_id),
+        parse_mode="HTML"
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("admin_delete_confirm_"))
+async def confirm_delete_poll(callback: types.CallbackQuery):
+    """Окончательно удаляет опрос из базы данных."""
+    if not is_admin(callback.from_user.id):
+        return await callback.answer("Доступ запрещен.", show_alert=True)
+
+    poll_id = int(callback.data.split("_")[3])
+    async with async_session() as session:
+        poll_to_delete = await session.get(Poll, poll_id)
+        if poll_to_delete:
+            await session.delete(poll_to_delete)
+            # Рендеры удаленного опроса сбрасываются и в других процессах (poll_cache_sync)
+            await notify_poll_changed(session, [poll_id])
+            await session.commit()
+            poll_cache.bump(poll_id)
+            mark_written(poll_id)
+            await callback.message.edit_text(f"✅ Опрос ID {poll_id} был успешно удален.")
+        else:
+            await callback.message.edit_text(f"⚠️ Опрос ID {poll_id} уже был удален ранее.")
+    # Каталог сбрасывается и когда опрос удалил другой процесс: здесь он мог еще числиться активным
+    poll_catalogue.invalidate()
+
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("admin_delete_cancel_"))
+async def cancel_delete_poll(callback: types.CallbackQuery):
+    """Отменяет процесс удаления и возвращает к карточке опроса."""
+    if not is_admin(callback.from_user.id):
+        return await callback.answer("Доступ запрещен.", show_alert=True)
+
+    poll_id = int(callback.data.split("_")[3])
+    async with async_session() as session:
+        poll = await session.get(Poll, poll_id)
+        if not poll:
+            await callback.message.edit_text("Опрос был удален.")
+            return
+
+        await callback.message.edit_text(render_admin_poll_card(poll),
+                                         reply_markup=create_admin_poll_card_keyboard(poll),
+                                         parse_mode="HTML")
+
+    await callback.answer("Удаление отменено.")
\ No newline at end of file
@@ -29,4 +29,68 @@ def is_admin(user_id: int) -> bool:
     :param user_id: Telegram ID пользователя.
     :return: True, если пользователь админ, иначе False.
     """
-    return user_id in ADMIN_IDS
\ No newline at end of file
+    return user_id in ADMIN_IDS
+
+
+# --- Настройки производительности ---
+# Сколько отрендеренных опросов держать в памяти процесса бота
+POLL_CACHE_SIZE = int(os.getenv("POLL_CACHE_SIZE", "1024"))
+# Сколько секунд рендер живет в кэше, если уведомление об изменении опроса не дошло
+POLL_CACHE_TTL_SECONDS = float(os.getenv("POLL_CACHE_TTL_SECONDS", "30"))
+
+# Очередь голосов: сколько голосов максимум пишется одной транзакцией
+# и сколько миллисекунд копится пачка, прежде чем уйти в БД
+VOTE_BATCH_SIZE = int(os.getenv("VOTE_BATCH_SIZE", "200"))
+VOTE_FLUSH_INTERVAL_MS = int(os.getenv("VOTE_FLUSH_INTERVAL_MS", "50"))
+
+# Минимальный интервал между правками одного сообщения с результатами
+EDIT_MIN_INTERVAL_MS = int(os.getenv("EDIT_MIN_INTERVAL_MS", "2000"))
+
+# Режим получения обновлений: "polling" (main.py) или "webhook" (через app.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Публичный адрес, на который Telegram будет слать обновления, например
+# https://bot.example.com/telegram/webhook, и секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+# Хранилище FSM в БД: через сколько секунд брошенное состояние удаляется
+# и сколько секунд прочитанное состояние можно отдавать из памяти процесса
+FSM_STATE_TTL_SECONDS = int(os.getenv("FSM_STATE_TTL_SECONDS", "86400"))
+FSM_CACHE_TTL_SECONDS = float(os.getenv("FSM_CACHE_TTL_SECONDS", "2"))
+
+# Порт, на котором процесс бота (main.py) отдает /metrics; 0 — не отдавать.
+# API отдает свои метрики (и метрики бота в режиме вебхука) на /metrics в app.py
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Сколько отрендеренных (сжатых) веб-отчетов держать в памяти процесса API
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "256"))
+# Через сколько секунд каталог активных опросов для /poll перечитывается из БД,
+# даже если процесс бота сам ничего не менял (изменения из API и других реплик)
+POLL_CATALOGUE_TTL_SECONDS = float(os.getenv("POLL_CATALOGUE_TTL_SECONDS", "30"))
+
+# Рассылка новых опросов всем пользователям бота: включена ли, сколько сообщений
+# в секунду отправлять (глобальный лимит Telegram ~30/с, часть оставляем на ответы
+# пользователям) и сколько адресатов обрабатывать между сохранениями прогресса
+BROADCAST_NEW_POLLS = os.getenv("BROADCAST_NEW_POLLS", "1") == "1"
+BROADCAST_RATE_PER_SECOND = float(os.getenv("BROADCAST_RATE_PER_SECOND", "25"))
+BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "500"))
+
+# Сколько опросов показывать на одной странице админ-консоли /list_polls
+ADMIN_CONSOLE_PAGE_SIZE = int(os.getenv("ADMIN_CONSOLE_PAGE_SIZE", "10"))
+
+# Самый долгий срок автоматического завершения опроса (в часах) для /newpoll и API:
+# без предела огромный срок не помещается в datetime
+MAX_POLL_DURATION_HOURS = int(os.getenv("MAX_POLL_DURATION_HOURS", str(24 * 365)))
+
+# Анти-флуд кнопок: сколько нажатий "голосовать" и "обновить результаты"
+# разрешено одному пользователю за THROTTLE_WINDOW_SECONDS; 0 — без ограничения
+THROTTLE_VOTE_LIMIT = int(os.getenv("THROTTLE_VOTE_LIMIT", "5"))
+THROTTLE_RESULTS_LIMIT = int(os.getenv("THROTTLE_RESULTS_LIMIT", "3"))
+THROTTLE_WINDOW_SECONDS = float(os.getenv("THROTTLE_WINDOW_SECONDS", "10"))
+
+# Шардированные счетчики голосов для "горячих" опросов: сколько слотов на вариант
+# (0 или 1 — обычный poll_option.votes_count), сколько секунд кэшировать суммы слотов
+# и раз во сколько секунд сверять счетчики с таблицей user (0 — не сверять)
+VOTE_COUNTER_SHARDS = int(os.getenv("VOTE_COUNTER_SHARDS", "0"))
+VOTE_COUNTS_CACHE_TTL_SECONDS = float(os.getenv("VOTE_COUNTS_CACHE_TTL_SECONDS", "1"))
+VOTE_RECONCILE_INTERVAL_SECONDS = float(os.getenv("VOTE_RECONCILE_INTERVAL_SECONDS", "300"))
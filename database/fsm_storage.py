@@ -0,0 +1,121 @@
+# KorpBot/database/fsm_storage.py
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from .models import FSMState
+
+logger = logging.getLogger(__name__)
+
+
+class SQLAlchemyStorage(BaseStorage):
+    """
+    Хранилище FSM aiogram в общей базе данных бота.
+    Состояние переживает перезапуск и видно всем репликам бота. Состояния, которые
+    не менялись дольше ttl_seconds, считаются брошенными и периодически удаляются.
+    Недавно прочитанные состояния кратко (cache_ttl_seconds) отдаются из памяти.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker, ttl_seconds: int = 86400,
+                 cache_ttl_seconds: float = 2.0, cache_size: int = 10000,
+                 cleanup_interval_seconds: int = 600):
+        self.session_factory = session_factory
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.cache_ttl = cache_ttl_seconds
+        self.cache_size = cache_size
+        self.cleanup_interval = cleanup_interval_seconds
+        # ключ -> (момент чтения, state, data)
+        self._cache: OrderedDict[str, tuple[float, str | None, dict]] = OrderedDict()
+        self._cleanup_task: asyncio.Task | None = None
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.business_connection_id or ''}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        await self._upsert(self._key(key), state=state)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        state, _ = await self._load(self._key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._upsert(self._key(key), data=dict(data))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, data = await self._load(self._key(key))
+        return dict(data)
+
+    async def close(self) -> None:
+        if self._cleanup_task:
+            self._cleanup_task.cancel()
+            self._cleanup_task = None
+
+    async def _load(self, key: str) -> tuple[str | None, dict]:
+        cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[0] < self.cache_ttl:
+            return cached[1], cached[2]
+
+        async with self.session_factory() as session:
+            row = (await session.execute(
+                select(FSMState.state, FSMState.data, FSMState.updated_at).filter(FSMState.key == key)
+            )).one_or_none()
+
+        if row is None or (row.updated_at and row.updated_at < datetime.now() - self.ttl):
+            state, data = None, {}
+        else:
+            state, data = row.state, row.data or {}
+        self._remember(key, state, data)
+        return state, data
+
+    async def _upsert(self, key: str, **values) -> None:
+        self._ensure_cleanup()
+        values["updated_at"] = datetime.now()
+        statement = insert(FSMState).values(key=key, **values)
+        statement = statement.on_conflict_do_update(index_elements=[FSMState.key], set_=values)
+        async with self.session_factory() as session:
+            await session.execute(statement)
+            await session.commit()
+
+        # Свою запись можно сразу отражать в кэше, если вторая половина состояния уже известна
+        cached = self._cache.pop(key, None)
+        if cached:
+            self._remember(key, values.get("state", cached[1]), values.get("data", cached[2]))
+
+    def _remember(self, key: str, state: str | None, data: dict) -> None:
+        if self.cache_ttl <= 0:
+            return
+        self._cache[key] = (time.monotonic(), state, data)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _ensure_cleanup(self) -> None:
+        if self._cleanup_task is None:
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def _cleanup_loop(self) -> None:
+        while True:
+            try:
+                async with self.session_factory() as session:
+                    result = await session.execute(
+                        delete(FSMState).where(FSMState.updated_at < datetime.now() - self.ttl)
+                    )
+                    await session.commit()
+                if result.rowcount:
+                    logger.info(f"Удалено брошенных состояний FSM: {result.rowcount}")
+            except Exception as e:
+                logger.warning(f"Не удалось очистить устаревшие состояния FSM: {e}")
+            await asyncio.sleep(self.cleanup_interval)
@@ -2,8 +2,10 @@
 
 import os
 import sys
+import time
+from alembic import command
+from alembic.config import Config
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from .models import Base
 from dotenv import load_dotenv
 load_dotenv()
 # 1. ПОЛУЧАЕМ URL ИЗ ПЕРЕМЕННОЙ ОКРУЖЕНИЯ, КОТОРУЮ ПЕРЕДАЕТ DOCKER COMPOSE
@@ -26,16 +28,73 @@ async_session = async_sessionmaker(
     class_=AsyncSession
 )
 
+# 4. НЕОБЯЗАТЕЛЬНАЯ РЕПЛИКА ДЛЯ ЧТЕНИЯ: отчеты, выгрузки и справочные запросы бота
+# идут на нее со своим пулом и не конкурируют с записью голосов. Без DATABASE_READ_URL
+# все читается с основной БД.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+read_engine = create_async_engine(DATABASE_READ_URL) if DATABASE_READ_URL else engine
+async_read_session = async_sessionmaker(
+    bind=read_engine,
+    expire_on_commit=False,
+    class_=AsyncSession
+)
+
+# Сколько секунд после записи читать затронутые данные с основной БД (запас на отставание реплики)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+_recent_writes: dict = {}
+
+
+def mark_written(key) -> None:
+    """
+    Отмечает, что этот процесс только что изменил данные по ключу (например, ID опроса).
+    Ближайшие READ_YOUR_WRITES_SECONDS чтения по этому ключу пойдут на основную БД.
+    """
+    if read_engine is engine:
+        return
+    now = time.monotonic()
+    _recent_writes[key] = now
+    if len(_recent_writes) > 10000:
+        for stale in [k for k, written_at in _recent_writes.items() if now - written_at >= READ_YOUR_WRITES_SECONDS]:
+            del _recent_writes[stale]
+
+
+def read_session(key=None) -> AsyncSession:
+    """Сессия для чтения: реплика, если по ключу не было свежей записи, иначе основная БД."""
+    written_at = _recent_writes.get(key) if key is not None else None
+    if written_at is not None and time.monotonic() - written_at < READ_YOUR_WRITES_SECONDS:
+        return async_session()
+    return async_read_session()
+
+# Корень проекта, где лежат alembic.ini и каталог migrations/
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _upgrade_to_head(connection):
+    config = Config(os.path.join(PROJECT_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(PROJECT_DIR, "migrations"))
+    config.attributes["connection"] = connection
+    command.upgrade(config, "head")
+
+
 async def init_models():
     """
-    Создает все таблицы в базе данных на основе моделей SQLAlchemy.
+    Приводит схему базы данных к последней миграции (alembic upgrade head).
+    В отличие от create_all, миграции добавляют индексы и ограничения и в уже существующие таблицы.
     """
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_upgrade_to_head)
 
 async def get_session() -> AsyncSession:
     """
     Зависимость для FastAPI для получения сессии базы данных.
     """
     async with async_session() as session:
+        yield session
+
+
+async def get_read_session() -> AsyncSession:
+    """
+    Зависимость для FastAPI для маршрутов, которые только читают (реплика, если настроена).
+    """
+    async with async_read_session() as session:
         yield session
\ No newline at end of file
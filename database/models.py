@@ -1,7 +1,7 @@
 # --- START OF FILE database/models.py ---
 
 from datetime import datetime
-from sqlalchemy import Column, String, Integer, Text, ForeignKey, TIMESTAMP, Boolean
+from sqlalchemy import Column, String, Integer, BigInteger, SmallInteger, Text, ForeignKey, TIMESTAMP, Boolean, UniqueConstraint, JSON, Index
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.ext.asyncio import AsyncAttrs
 
@@ -12,12 +12,17 @@ Base = declarative_base()
 
 class Poll(Base):
     __tablename__ = 'poll'
+    # /poll: активные опросы, новые первыми
+    __table_args__ = (Index('ix_poll_status_created_at', 'status', 'created_at'),)
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False)
     created_at = Column(TIMESTAMP, default=datetime.now)
-    # duration = Column(Integer) # Это поле не используется, можно раскомментировать при необходимости
     status = Column(Boolean, default=True)
+    # Срок опроса: в этот момент он завершится сам (poll_expiry.py); NULL — завершается вручную
+    closes_at = Column(TIMESTAMP, nullable=True)
+    # Растет при каждом голосе и смене статуса; по ней строятся ETag и кэш отчетов API
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     options = relationship("PollOption", back_populates="poll", cascade="all, delete-orphan")
     participants = relationship("User", back_populates="poll", cascade="all, delete-orphan")
@@ -29,9 +34,12 @@ class PollOption(Base):
     __tablename__ = 'poll_option'
 
     id = Column(Integer, primary_key=True, index=True)
-    poll_id = Column(Integer, ForeignKey('poll.id', ondelete="CASCADE"), nullable=False)
+    poll_id = Column(Integer, ForeignKey('poll.id', ondelete="CASCADE"), nullable=False, index=True)
     option_text = Column(Text, nullable=False)
     votes_count = Column(Integer, default=0)
+    # Голоса из старого хранилища без списка проголосовавших (tools/import_polls.py);
+    # итоги по таблице user считаются поверх них
+    imported_votes = Column(Integer, nullable=False, default=0, server_default="0")
 
     poll = relationship("Poll", back_populates="options")
     voters = relationship("User", back_populates="option", cascade="all, delete-orphan")
@@ -39,14 +47,22 @@ class PollOption(Base):
 
 class User(Base):
     __tablename__ = 'user'
+    # Один голос на пользователя в опросе; на этот ключ опирается upsert в record_votes_batch
+    __table_args__ = (
+        UniqueConstraint('poll_id', 'user_tg_id', name='uq_user_poll_id_user_tg_id'),
+        # Постраничный список и выгрузка проголосовавших опроса
+        Index('ix_user_poll_id_id', 'poll_id', 'id'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     poll_id = Column(Integer, ForeignKey('poll.id', ondelete="CASCADE"), nullable=False)
-    user_tg_id = Column(Integer, nullable=False, index=True)
-    option_id = Column(Integer, ForeignKey('poll_option.id', ondelete="CASCADE"), nullable=False)
+    user_tg_id = Column(BigInteger, nullable=False, index=True)
+    option_id = Column(Integer, ForeignKey('poll_option.id', ondelete="CASCADE"), nullable=False, index=True)
 
     # --- ВОТ ЭТО ПОЛЕ ДОЛЖНО БЫТЬ ---
     user_full_name = Column(String, nullable=True)
+    # Время последнего голоса (выставляется и при смене варианта)
+    voted_at = Column(TIMESTAMP, default=datetime.now)
 
     poll = relationship("Poll", back_populates="participants")
     option = relationship("PollOption", back_populates="voters")
@@ -58,7 +74,71 @@ class TelegramPoll(Base):
 
     # ID из Telegram может быть очень длинным, используем String
     telegram_poll_id = Column(String, primary_key=True)
-    poll_id = Column(Integer, ForeignKey('poll.id', ondelete="CASCADE"), nullable=False)
+    poll_id = Column(Integer, ForeignKey('poll.id', ondelete="CASCADE"), nullable=False, index=True)
 
     poll = relationship("Poll", back_populates="telegram_map")
-# --- КОНЕЦ ДОБАВЛЕНИЯ ---
\ No newline at end of file
+# --- КОНЕЦ ДОБАВЛЕНИЯ ---
+
+
+class FSMState(Base):
+    """Состояние FSM aiogram (например, недособранный опрос из /newpoll), общее для всех реплик бота."""
+    __tablename__ = 'fsm_state'
+
+    key = Column(String(255), primary_key=True)
+    state = Column(String(255), nullable=True)
+    data = Column(JSON, nullable=True)
+    updated_at = Column(TIMESTAMP, default=datetime.now, onupdate=datetime.now, index=True)
+
+
+class BotSubscriber(Base):
+    """Пользователь, отправивший боту /start; вместе с проголосовавшими — адресаты рассылок."""
+    __tablename__ = 'bot_subscriber'
+
+    user_tg_id = Column(BigInteger, primary_key=True)
+    first_seen_at = Column(TIMESTAMP, default=datetime.now)
+
+
+class Broadcast(Base):
+    """Рассылка нового опроса с контрольной точкой: после перезапуска продолжается с last_user_tg_id."""
+    __tablename__ = 'broadcast'
+
+    id = Column(Integer, primary_key=True)
+    poll_id = Column(Integer, ForeignKey('poll.id', ondelete="CASCADE"), nullable=False)
+    # Куда присылать прогресс: чат администратора и сообщение, которое редактируется
+    admin_chat_id = Column(BigInteger, nullable=False)
+    progress_message_id = Column(Integer, nullable=True)
+    status = Column(String(16), nullable=False, default="running")  # running / done / stopped
+    last_user_tg_id = Column(BigInteger, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    started_at = Column(TIMESTAMP, default=datetime.now)
+    finished_at = Column(TIMESTAMP, nullable=True)
+
+
+class PollSnapshot(Base):
+    """Итоги завершенного опроса, замороженные в момент закрытия; удаляются при повторном открытии."""
+    __tablename__ = 'poll_snapshot'
+
+    poll_id = Column(Integer, ForeignKey('poll.id', ondelete="CASCADE"), primary_key=True)
+    title = Column(String(255), nullable=False)
+    # Версия опроса на момент закрытия — для ETag и кэшей
+    version = Column(Integer, nullable=False)
+    total_voters = Column(Integer, nullable=False)
+    # [{"id": ..., "option_text": ..., "votes_count": ...}] в порядке вариантов
+    options = Column(JSON, nullable=False)
+    telegram_text = Column(Text, nullable=False)
+    created_at = Column(TIMESTAMP, default=datetime.now)
+
+
+class PollOptionCounter(Base):
+    """Слот шардированного счетчика голосов (VOTE_COUNTER_SHARDS): итог варианта — votes_count плюс сумма слотов."""
+    __tablename__ = 'poll_option_counter'
+
+    option_id = Column(Integer, ForeignKey('poll_option.id', ondelete="CASCADE"), primary_key=True)
+    slot = Column(SmallInteger, primary_key=True)
+    poll_id = Column(Integer, ForeignKey('poll.id', ondelete="CASCADE"), nullable=False, index=True)
+    # Может быть отрицательным: голос, перенесенный с варианта, вычитается из слота пользователя
+    votes = Column(Integer, nullable=False, default=0, server_default="0")
+    # Сколько раз слот менялся; голоса в этом режиме не увеличивают Poll.version, поэтому ETag учитывает это поле
+    changes = Column(Integer, nullable=False, default=0, server_default="0")
@@ -0,0 +1,91 @@
+# KorpBot/edit_scheduler.py
+
+import asyncio
+import logging
+from collections import OrderedDict
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup
+
+from config import EDIT_MIN_INTERVAL_MS
+
+logger = logging.getLogger(__name__)
+
+
+class EditScheduler:
+    """
+    Планировщик редактирования "живых" сообщений с результатами.
+    Для каждого сообщения (chat_id, message_id) хранится только последний текст,
+    а отправляется он не чаще одного раза в min_interval_ms. Неизменившийся текст
+    не отправляется вовсе, а RetryAfter от Telegram выдерживается перед повтором.
+    """
+
+    def __init__(self, min_interval_ms: int = 2000, max_tracked: int = 10000):
+        self.min_interval = min_interval_ms / 1000
+        self.max_tracked = max_tracked
+        self._pending: dict[tuple[int, int], tuple[str, InlineKeyboardMarkup | None]] = {}
+        self._tasks: dict[tuple[int, int], asyncio.Task] = {}
+        # (chat_id, message_id) -> (время последней отправки, отпечаток отправленного)
+        self._sent: OrderedDict[tuple[int, int], tuple[float, tuple]] = OrderedDict()
+        self.edits_sent = 0
+        self.edits_skipped = 0
+
+    def schedule(self, bot: Bot, chat_id: int, message_id: int, text: str,
+                 reply_markup: InlineKeyboardMarkup | None = None) -> None:
+        """Запоминает новый текст сообщения; сама правка уйдет в Telegram позже."""
+        key = (chat_id, message_id)
+        if key in self._pending:
+            self.edits_skipped += 1
+        self._pending[key] = (text, reply_markup)
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._flush_loop(bot, key))
+
+    async def close(self) -> None:
+        """Дожидается отправки всех запланированных правок."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def _flush_loop(self, bot: Bot, key: tuple[int, int]) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while key in self._pending:
+                last_sent_at, last_fingerprint = self._sent.get(key, (0.0, None))
+                delay = last_sent_at + self.min_interval - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                text, reply_markup = self._pending.pop(key)
+                fingerprint = (text, reply_markup.model_dump_json() if reply_markup else None)
+                if fingerprint == last_fingerprint:
+                    self.edits_skipped += 1
+                    continue
+
+                try:
+                    await bot.edit_message_text(text=text, chat_id=key[0], message_id=key[1],
+                                                reply_markup=reply_markup, parse_mode="HTML")
+                    self.edits_sent += 1
+                except TelegramRetryAfter as e:
+                    logger.warning(f"Telegram просит подождать {e.retry_after} с. перед правкой {key}")
+                    # Более свежий текст, если он уже пришел, важнее текущего
+                    self._pending.setdefault(key, (text, reply_markup))
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except TelegramBadRequest as e:
+                    # "message is not modified" и подобное — повторять бессмысленно
+                    logger.debug(f"Правка сообщения {key} отклонена: {e}")
+                except Exception as e:
+                    logger.warning(f"Не удалось отредактировать сообщение: {e}")
+
+                self._remember(key, loop.time(), fingerprint)
+        finally:
+            self._tasks.pop(key, None)
+
+    def _remember(self, key: tuple[int, int], sent_at: float, fingerprint: tuple) -> None:
+        self._sent[key] = (sent_at, fingerprint)
+        self._sent.move_to_end(key)
+        while len(self._sent) > self.max_tracked:
+            self._sent.popitem(last=False)
+
+
+edit_scheduler = EditScheduler(min_interval_ms=EDIT_MIN_INTERVAL_MS)
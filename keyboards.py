@@ -94,6 +94,35 @@ def create_admin_poll_keyboard(poll) -> InlineKeyboardMarkup:
     return keyboard
 
 
+def create_admin_console_keyboard(polls: list, offset: int, page_size: int, has_next: bool) -> InlineKeyboardMarkup:
+    """Клавиатура страницы админ-консоли: кнопка на каждый опрос и переход между страницами."""
+    buttons = []
+    for poll in polls:
+        status_emoji = "🟢" if poll.status else "🔴"
+        buttons.append([InlineKeyboardButton(text=f"{status_emoji} ID {poll.id}: {poll.title}",
+                                             callback_data=f"admin_card_{poll.id}_{offset}")])
+
+    navigation = []
+    if offset > 0:
+        navigation.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"admin_list_{max(offset - page_size, 0)}"))
+    if has_next:
+        navigation.append(InlineKeyboardButton(text="Вперед ➡️", callback_data=f"admin_list_{offset + page_size}"))
+    if navigation:
+        buttons.append(navigation)
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
+    return keyboard
+
+
+def create_admin_poll_card_keyboard(poll, offset: int = 0) -> InlineKeyboardMarkup:
+    """Клавиатура управления опросом в админ-консоли с возвратом к странице списка."""
+    buttons = create_admin_poll_keyboard(poll).inline_keyboard + [
+        [InlineKeyboardButton(text="🔙 К списку опросов", callback_data=f"admin_list_{offset}")]
+    ]
+    keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
+    return keyboard
+
+
 # НОВАЯ КЛАВИАТУРА ПОДТВЕРЖДЕНИЯ
 def create_delete_confirm_keyboard(poll_id: int) -> InlineKeyboardMarkup:
     """Создает клавиатуру для подтверждения удаления опроса."""
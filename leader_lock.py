@@ -0,0 +1,146 @@
+# KorpBot/leader_lock.py
+
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from aiogram import Bot
+from sqlalchemy import text
+
+from broadcast import broadcaster
+from database.main import engine
+from poll_expiry import poll_expiry
+from vote_counters import vote_reconciler
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки, которую держит процесс-лидер фоновых задач
+BACKGROUND_LEADER_KEY = "korpbot_background"
+
+
+class LeaderLock:
+    """
+    Выбор одного процесса для фоновых задач-одиночек (продолжение рассылок, сроки
+    опросов, сверка счетчиков). В режиме вебхука бот живет в каждом воркере API,
+    а эти задачи должны работать ровно в одном процессе, иначе опросы закрываются
+    дважды, а рассылки уходят по нескольку раз.
+    Лидер держит сессионную advisory-блокировку Postgres на отдельном соединении:
+    если процесс падает, Postgres снимает блокировку сам, и ее забирает следующий.
+    Остальные процессы раз в retry_seconds пробуют стать лидером.
+    Без Postgres (локальный запуск на SQLite) процесс один и всегда лидер.
+    """
+
+    def __init__(self, key: str, retry_seconds: float = 10.0):
+        self.key = key
+        self.retry = retry_seconds
+        self.is_leader = False
+        self._connection = None
+        self._task: asyncio.Task | None = None
+        self._on_elected: Callable[[], Awaitable[None]] | None = None
+        self._on_lost: Callable[[], Awaitable[None]] | None = None
+
+    async def start(self, on_elected: Callable[[], Awaitable[None]],
+                    on_lost: Callable[[], Awaitable[None]]) -> None:
+        """Запускает on_elected, как только процесс станет лидером; on_lost — если лидерство потеряно."""
+        self._on_elected = on_elected
+        self._on_lost = on_lost
+        if not await self._elect():
+            self._task = asyncio.create_task(self._wait())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._connection is not None:
+            # Соединение не возвращается в пул, а закрывается: вместе с ним снимается
+            # блокировка, и лидером станет другой процесс
+            await self._connection.invalidate()
+            self._connection = None
+        self.is_leader = False
+
+    async def _elect(self) -> bool:
+        if engine.dialect.name != "postgresql":
+            self.is_leader = True
+        else:
+            connection = await engine.connect()
+            try:
+                acquired = (await connection.execute(
+                    text("SELECT pg_try_advisory_lock(hashtext(:key))"), {"key": self.key}
+                )).scalar()
+                # Соединение остается открытым без транзакции: блокировка сессионная
+                await connection.commit()
+            except Exception:
+                await connection.close()
+                raise
+            if not acquired:
+                await connection.close()
+                return False
+            raw = await connection.get_raw_connection()
+            raw.driver_connection.add_termination_listener(self._on_terminate)
+            self._connection = connection
+            self.is_leader = True
+        logger.info("Процесс стал лидером фоновых задач.")
+        try:
+            await self._on_elected()
+        except Exception:
+            # Иначе блокировка осталась бы за процессом, в котором задачи не работают
+            await self.close()
+            raise
+        return True
+
+    async def _wait(self) -> None:
+        while True:
+            await asyncio.sleep(self.retry)
+            try:
+                if await self._elect():
+                    return
+            except Exception as e:
+                logger.warning(f"Не удалось проверить лидерство фоновых задач: {e}")
+
+    def _on_terminate(self, connection) -> None:
+        # Соединение с блокировкой оборвалось: лидером может стать другой процесс
+        logger.error("Соединение лидера фоновых задач потеряно, задачи останавливаются.")
+        self._connection = None
+        self.is_leader = False
+        self._task = asyncio.get_running_loop().create_task(self._step_down())
+
+    async def _step_down(self) -> None:
+        try:
+            await self._on_lost()
+        except Exception as e:
+            logger.error(f"Не удалось остановить фоновые задачи после потери лидерства: {e}")
+        await self._wait()
+
+
+background_leader = LeaderLock(BACKGROUND_LEADER_KEY)
+
+
+async def start_background_tasks(bot: Bot) -> None:
+    """
+    Запускает задачи-одиночки в процессе-лидере: сразу или когда процесс им станет.
+    Голоса, вебхук и кэши работают в каждом процессе и сюда не входят.
+    """
+
+    async def on_elected() -> None:
+        # Рассылки, прерванные прошлой остановкой, продолжаются с контрольной точки
+        await broadcaster.resume(bot)
+        # Сроки опросов: куча собирается из БД, дальше планировщик спит до ближайшего
+        await poll_expiry.start(bot)
+        # Периодическая сверка счетчиков голосов с таблицей user
+        vote_reconciler.start()
+
+    await background_leader.start(on_elected, _stop_tasks)
+
+
+async def stop_background_tasks() -> None:
+    """Останавливает задачи-одиночки (рассылки — на контрольной точке) и отдает лидерство."""
+    # Сначала задачи, потом блокировка: новый лидер не должен застать их работающими
+    await _stop_tasks()
+    await background_leader.close()
+
+
+async def _stop_tasks() -> None:
+    await broadcaster.close()
+    await poll_expiry.close()
+    await vote_reconciler.close()
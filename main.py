@@ -5,14 +5,16 @@ import logging
 import sys
 import os
 from dotenv import load_dotenv
-from aiogram import Bot, Dispatcher
-from aiogram.client.default import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage
 
-# Импортируем роутеры
-from commands import router as commands_router
-from general import router as general_router
-from database.main import init_models
+from bot_factory import create_bot, create_dispatcher
+from config import BOT_MODE, METRICS_PORT
+from database.main import engine, init_models, read_engine
+from metrics import instrument_engine
+from prometheus_client import start_http_server
+from vote_queue import vote_queue
+from edit_scheduler import edit_scheduler
+from leader_lock import start_background_tasks, stop_background_tasks
+from poll_cache_sync import poll_cache_sync
 
 # Настраиваем логирование
 logging.basicConfig(level=logging.INFO, stream=sys.stdout)
@@ -26,16 +28,18 @@ if not BOT_TOKEN:
     logger.critical("Ошибка: Необходимо установить переменную окружения BOT_TOKEN")
     sys.exit("Ошибка: BOT_TOKEN не найден")
 
+if BOT_MODE == "webhook":
+    # Обновления принимает API (app.py), запускать long polling параллельно нельзя
+    logger.critical("BOT_MODE=webhook: бот работает внутри API-процесса, main.py не нужен.")
+    sys.exit("Ошибка: long polling недоступен в режиме вебхука")
+
 async def main():
     # --- Инициализация ---
-    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+    bot = create_bot(BOT_TOKEN)
 
     # --- Регистрация роутеров ---
     logger.info("Регистрация роутеров...")
-    dp.include_router(commands_router)
-    dp.include_router(general_router)
+    dp = create_dispatcher()
     logger.info("Роутеры зарегистрированы.")
 
     # --- Инициализация БД ---
@@ -49,8 +53,32 @@ async def main():
 
     await bot.delete_webhook(drop_pending_updates=True)
 
+    # --- Метрики процесса бота ---
+    instrument_engine(engine)
+    if read_engine is not engine:
+        instrument_engine(read_engine, "replica")
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+        logger.info(f"Метрики бота доступны на порту {METRICS_PORT} (/metrics).")
+
+    # --- Фоновая запись голосов ---
+    vote_queue.start()
+    # Рендеры опросов, измененных другими процессами, вытесняются по каналу poll_changes
+    await poll_cache_sync.start()
+    # Рассылки, сроки опросов и сверка счетчиков работают в одном процессе-лидере,
+    # даже если рядом запущены воркеры API в режиме вебхука (leader_lock.py)
+    await start_background_tasks(bot)
+
     logger.info("Запуск получения обновлений...")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        # Рассылки останавливаются на контрольной точке и продолжатся после запуска
+        await stop_background_tasks()
+        await poll_cache_sync.close()
+        # Дописываем в БД все голоса, принятые до остановки
+        await vote_queue.close()
+        await edit_scheduler.close()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,122 @@
+# KorpBot/metrics.py
+
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+from fastapi import Request
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from poll_cache import poll_cache
+
+# Границы корзин подобраны под задержки от единиц миллисекунд до секунд
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+BOT_HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Время работы хэндлеров бота",
+    ["event", "handler"], buckets=LATENCY_BUCKETS,
+)
+BOT_HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Исключения в хэндлерах бота", ["event", "handler"],
+)
+BOT_THROTTLED = Counter(
+    "bot_throttled_total", "Нажатия кнопок, отклоненные анти-флудом", ["handler"],
+)
+VOTE_COUNTER_MISMATCHES = Counter(
+    "vote_counter_mismatches_total", "Счетчики вариантов, исправленные сверкой с таблицей user",
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds", "Время обработки HTTP-запросов API",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Соединения, выданные из пула", ["engine"])
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "Соединения сверх pool_size", ["engine"])
+DB_POOL_SIZE = Gauge("db_pool_size", "Размер пула соединений", ["engine"])
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_wait_seconds", "Ожидание свободного соединения из пула",
+    ["engine"], buckets=LATENCY_BUCKETS,
+)
+POLL_CACHE_HITS = Gauge("poll_cache_hits", "Попадания в кэш рендера опросов")
+POLL_CACHE_MISSES = Gauge("poll_cache_misses", "Промахи кэша рендера опросов")
+POLL_CACHE_HITS.set_function(lambda: poll_cache.hits)
+POLL_CACHE_MISSES.set_function(lambda: poll_cache.misses)
+
+
+def handler_label(event: TelegramObject) -> tuple[str, str]:
+    """
+    Возвращает (тип события, метку хэндлера) без высококардинальных частей:
+    "vote_15" -> "vote", "admin_poll_activate_3" -> "admin_poll_activate", "/poll" -> "/poll".
+    """
+    if isinstance(event, CallbackQuery):
+        parts = []
+        for part in (event.data or "").split("_"):
+            if part.isdigit():
+                break
+            parts.append(part)
+        return "callback_query", "_".join(parts) or "unknown"
+    if isinstance(event, Message):
+        text = event.text or ""
+        if text.startswith("/"):
+            return "message", text.split()[0].split("@")[0]
+        return "message", "text"
+    return type(event).__name__, "other"
+
+
+class BotMetricsMiddleware(BaseMiddleware):
+    """Замеряет время каждого хэндлера бота с разбивкой по команде и префиксу колбэка."""
+
+    async def __call__(self, handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: dict[str, Any]) -> Any:
+        labels = handler_label(event)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            BOT_HANDLER_ERRORS.labels(*labels).inc()
+            raise
+        finally:
+            BOT_HANDLER_SECONDS.labels(*labels).observe(time.perf_counter() - started)
+
+
+async def http_metrics_middleware(request: Request, call_next):
+    """HTTP-middleware FastAPI: время каждого маршрута по его шаблону пути."""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = route.path if route else "unmatched"
+        HTTP_REQUEST_SECONDS.labels(request.method, path, str(status)).observe(time.perf_counter() - started)
+
+
+def instrument_engine(engine: AsyncEngine, name: str = "primary") -> None:
+    """Подключает метрики пула соединений движка SQLAlchemy."""
+    pool = engine.sync_engine.pool
+    if not hasattr(pool, "checkedout"):
+        # Например, NullPool/StaticPool — считать нечего
+        return
+    DB_POOL_CHECKED_OUT.labels(name).set_function(pool.checkedout)
+    DB_POOL_OVERFLOW.labels(name).set_function(pool.overflow)
+    DB_POOL_SIZE.labels(name).set_function(pool.size)
+
+    connect = pool.connect
+    wait_histogram = DB_POOL_WAIT_SECONDS.labels(name)
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            wait_histogram.observe(time.perf_counter() - started)
+
+    pool.connect = timed_connect
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Текущие метрики в текстовом формате Prometheus и их content-type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
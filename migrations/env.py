@@ -0,0 +1,52 @@
+# KorpBot/migrations/env.py
+
+import asyncio
+from logging.config import fileConfig
+
+from alembic import context
+
+from database.models import Base
+
+config = context.config
+target_metadata = Base.metadata
+
+# При запуске из init_models соединение уже передано, а логирование настроено приложением
+if config.config_file_name is not None and "connection" not in config.attributes:
+    fileConfig(config.config_file_name)
+
+
+def run_migrations_offline():
+    """Генерация SQL без подключения к БД: alembic upgrade head --sql."""
+    from database.main import DATABASE_URL
+
+    context.configure(url=DATABASE_URL, target_metadata=target_metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection):
+    context.configure(connection=connection, target_metadata=target_metadata)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_async_migrations():
+    from database.main import engine
+
+    async with engine.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+        await connection.commit()
+
+
+def run_migrations_online():
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        do_run_migrations(connection)
+    else:
+        asyncio.run(run_async_migrations())
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,132 @@
+"""Начальная схема
+
+Совпадает с тем, что раньше создавал Base.metadata.create_all при старте.
+Базы, созданные до появления миграций, доводятся до этой схемы без потери
+данных: существующие таблицы не пересоздаются, добавляются только недостающие
+колонки и уникальный индекс голосов. Повторные голоса одного пользователя,
+которые старый код мог записать, перед созданием индекса удаляются (остается
+последний), а счетчики затронутых опросов пересчитываются по оставшимся голосам.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _deduplicate_votes(bind):
+    """
+    Оставляет по одному голосу на пару (poll_id, user_tg_id) — самый поздний
+    по voted_at, затем по id — и пересчитывает votes_count вариантов тех опросов,
+    где были повторы, одним GROUP BY по таблице user.
+    """
+    user = sa.table("user", sa.column("id"), sa.column("poll_id"), sa.column("user_tg_id"),
+                    sa.column("option_id"), sa.column("voted_at"))
+    poll_option = sa.table("poll_option", sa.column("id"), sa.column("poll_id"), sa.column("votes_count"))
+
+    poll_ids = bind.execute(
+        sa.select(user.c.poll_id).distinct()
+        .group_by(user.c.poll_id, user.c.user_tg_id).having(sa.func.count() > 1)
+    ).scalars().all()
+    if not poll_ids:
+        return
+
+    ranked = sa.select(
+        user.c.id,
+        sa.func.row_number().over(
+            partition_by=(user.c.poll_id, user.c.user_tg_id),
+            order_by=(user.c.voted_at.is_(None), user.c.voted_at.desc(), user.c.id.desc()),
+        ).label("rank"),
+    ).where(user.c.poll_id.in_(poll_ids)).subquery()
+    bind.execute(sa.delete(user).where(user.c.id.in_(sa.select(ranked.c.id).where(ranked.c.rank > 1))))
+
+    votes = (
+        sa.select(user.c.option_id, sa.func.count().label("votes"))
+        .where(user.c.poll_id.in_(poll_ids)).group_by(user.c.option_id).subquery()
+    )
+    bind.execute(sa.update(poll_option).where(poll_option.c.poll_id.in_(poll_ids)).values(votes_count=0))
+    bind.execute(
+        sa.update(poll_option).where(poll_option.c.id == votes.c.option_id).values(votes_count=votes.c.votes)
+    )
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if "poll" not in tables:
+        op.create_table(
+            "poll",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("title", sa.String(255), nullable=False),
+            sa.Column("created_at", sa.TIMESTAMP()),
+            sa.Column("status", sa.Boolean()),
+            sa.Column("version", sa.Integer(), nullable=False, server_default="1"),
+        )
+        op.create_index("ix_poll_id", "poll", ["id"])
+    elif "version" not in {c["name"] for c in inspector.get_columns("poll")}:
+        op.add_column("poll", sa.Column("version", sa.Integer(), nullable=False, server_default="1"))
+
+    if "poll_option" not in tables:
+        op.create_table(
+            "poll_option",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("poll_id", sa.Integer(), sa.ForeignKey("poll.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("option_text", sa.Text(), nullable=False),
+            sa.Column("votes_count", sa.Integer()),
+        )
+        op.create_index("ix_poll_option_id", "poll_option", ["id"])
+
+    if "user" not in tables:
+        op.create_table(
+            "user",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("poll_id", sa.Integer(), sa.ForeignKey("poll.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("user_tg_id", sa.Integer(), nullable=False),
+            sa.Column("option_id", sa.Integer(), sa.ForeignKey("poll_option.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("user_full_name", sa.String(), nullable=True),
+            sa.Column("voted_at", sa.TIMESTAMP()),
+            sa.UniqueConstraint("poll_id", "user_tg_id", name="uq_user_poll_id_user_tg_id"),
+        )
+        op.create_index("ix_user_id", "user", ["id"])
+        op.create_index("ix_user_user_tg_id", "user", ["user_tg_id"])
+    else:
+        if "voted_at" not in {c["name"] for c in inspector.get_columns("user")}:
+            op.add_column("user", sa.Column("voted_at", sa.TIMESTAMP()))
+        existing = {i["name"] for i in inspector.get_indexes("user")}
+        existing |= {c["name"] for c in inspector.get_unique_constraints("user")}
+        if "uq_user_poll_id_user_tg_id" not in existing:
+            _deduplicate_votes(op.get_bind())
+            op.create_index("uq_user_poll_id_user_tg_id", "user", ["poll_id", "user_tg_id"], unique=True)
+
+    if "telegram_poll" not in tables:
+        op.create_table(
+            "telegram_poll",
+            sa.Column("telegram_poll_id", sa.String(), primary_key=True),
+            sa.Column("poll_id", sa.Integer(), sa.ForeignKey("poll.id", ondelete="CASCADE"), nullable=False),
+        )
+
+    if "fsm_state" not in tables:
+        op.create_table(
+            "fsm_state",
+            sa.Column("key", sa.String(255), primary_key=True),
+            sa.Column("state", sa.String(255), nullable=True),
+            sa.Column("data", sa.JSON(), nullable=True),
+            sa.Column("updated_at", sa.TIMESTAMP()),
+        )
+        op.create_index("ix_fsm_state_updated_at", "fsm_state", ["updated_at"])
+
+
+def downgrade():
+    op.drop_table("fsm_state")
+    op.drop_table("telegram_poll")
+    op.drop_table("user")
+    op.drop_table("poll_option")
+    op.drop_table("poll")
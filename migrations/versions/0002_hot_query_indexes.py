@@ -0,0 +1,37 @@
+"""Индексы под горячие запросы бота и API
+
+- poll_option(poll_id): варианты опроса (get_poll_text_and_options, итоги, JSON)
+- user(option_id): итоги GROUP BY и каскадное удаление вариантов
+- user(poll_id, id): постраничный список и выгрузка проголосовавших
+- poll(status, created_at): /poll — активные опросы, новые первыми
+- telegram_poll(poll_id): каскадное удаление опроса
+
+Пара user(poll_id, user_tg_id) уже покрыта уникальным индексом из 0001.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_poll_option_poll_id", "poll_option", ["poll_id"], if_not_exists=True)
+    op.create_index("ix_user_option_id", "user", ["option_id"], if_not_exists=True)
+    op.create_index("ix_user_poll_id_id", "user", ["poll_id", "id"], if_not_exists=True)
+    op.create_index("ix_poll_status_created_at", "poll", ["status", "created_at"], if_not_exists=True)
+    op.create_index("ix_telegram_poll_poll_id", "telegram_poll", ["poll_id"], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index("ix_telegram_poll_poll_id", table_name="telegram_poll")
+    op.drop_index("ix_poll_status_created_at", table_name="poll")
+    op.drop_index("ix_user_poll_id_id", table_name="user")
+    op.drop_index("ix_user_option_id", table_name="user")
+    op.drop_index("ix_poll_option_poll_id", table_name="poll_option")
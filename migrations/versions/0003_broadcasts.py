@@ -0,0 +1,44 @@
+"""Рассылки новых опросов
+
+- bot_subscriber: пользователи, отправившие /start
+- broadcast: прогресс рассылок для продолжения после перезапуска
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "bot_subscriber",
+        sa.Column("user_tg_id", sa.BigInteger(), primary_key=True),
+        sa.Column("first_seen_at", sa.TIMESTAMP()),
+    )
+    op.create_table(
+        "broadcast",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("poll_id", sa.Integer(), sa.ForeignKey("poll.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("admin_chat_id", sa.BigInteger(), nullable=False),
+        sa.Column("progress_message_id", sa.Integer(), nullable=True),
+        sa.Column("status", sa.String(16), nullable=False),
+        sa.Column("last_user_tg_id", sa.BigInteger(), nullable=False),
+        sa.Column("total", sa.Integer(), nullable=False),
+        sa.Column("sent", sa.Integer(), nullable=False),
+        sa.Column("failed", sa.Integer(), nullable=False),
+        sa.Column("started_at", sa.TIMESTAMP()),
+        sa.Column("finished_at", sa.TIMESTAMP(), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table("broadcast")
+    op.drop_table("bot_subscriber")
@@ -0,0 +1,31 @@
+"""Снимки итогов завершенных опросов
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "poll_snapshot",
+        sa.Column("poll_id", sa.Integer(), sa.ForeignKey("poll.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("title", sa.String(255), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("total_voters", sa.Integer(), nullable=False),
+        sa.Column("options", sa.JSON(), nullable=False),
+        sa.Column("telegram_text", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP()),
+    )
+
+
+def downgrade():
+    op.drop_table("poll_snapshot")
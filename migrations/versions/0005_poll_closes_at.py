@@ -0,0 +1,22 @@
+"""Срок автоматического завершения опроса
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("poll", sa.Column("closes_at", sa.TIMESTAMP(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("poll", "closes_at")
@@ -0,0 +1,31 @@
+"""Слоты шардированных счетчиков голосов
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "poll_option_counter",
+        sa.Column("option_id", sa.Integer(), sa.ForeignKey("poll_option.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("slot", sa.SmallInteger(), primary_key=True),
+        sa.Column("poll_id", sa.Integer(), sa.ForeignKey("poll.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("votes", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("changes", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.create_index("ix_poll_option_counter_poll_id", "poll_option_counter", ["poll_id"])
+
+
+def downgrade():
+    op.drop_index("ix_poll_option_counter_poll_id", table_name="poll_option_counter")
+    op.drop_table("poll_option_counter")
@@ -0,0 +1,28 @@
+"""user.user_tg_id в BIGINT
+
+ID пользователей Telegram давно вышли за пределы INTEGER, и голос такого
+пользователя валил всю пачку в очереди голосов. На PostgreSQL смена типа
+переписывает таблицу user и ее индексы под эксклюзивной блокировкой.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("user") as batch:
+        batch.alter_column("user_tg_id", type_=sa.BigInteger(), existing_type=sa.Integer(), existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table("user") as batch:
+        batch.alter_column("user_tg_id", type_=sa.Integer(), existing_type=sa.BigInteger(), existing_nullable=False)
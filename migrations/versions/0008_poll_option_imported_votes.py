@@ -0,0 +1,26 @@
+"""Голоса, импортированные без списка проголосовавших
+
+Старое хранилище могло держать только счетчики по вариантам. Такие голоса
+tools/import_polls.py пишет в poll_option.imported_votes, а итоги по таблице
+user (отчеты, снимки, сверка счетчиков) считаются поверх них.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("poll_option", sa.Column("imported_votes", sa.Integer(), nullable=False, server_default="0"))
+
+
+def downgrade():
+    op.drop_column("poll_option", "imported_votes")
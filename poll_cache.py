@@ -0,0 +1,66 @@
+# KorpBot/poll_cache.py
+
+import time
+from collections import OrderedDict
+
+from config import POLL_CACHE_SIZE, POLL_CACHE_TTL_SECONDS
+
+
+class PollRenderCache:
+    """
+    Ограниченный LRU-кэш отрендеренного текста опроса и списка его вариантов.
+    Ключ — (poll_id, версия). Любое изменение опроса увеличивает его версию,
+    поэтому устаревшая запись просто перестает находиться и вытесняется.
+    Версии локальны для процесса: изменения из других процессов приходят через
+    poll_cache_sync, а на случай потери подписки запись живет не дольше ttl_seconds.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl_seconds
+        self._entries: OrderedDict[tuple[int, int], tuple[float, str, list]] = OrderedDict()
+        self._versions: dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, poll_id: int) -> int:
+        return self._versions.get(poll_id, 0)
+
+    def bump(self, poll_id: int) -> int:
+        """Инвалидирует закэшированный рендер опроса. Возвращает новую версию."""
+        version = self.version(poll_id)
+        self._entries.pop((poll_id, version), None)
+        self._versions[poll_id] = version + 1
+        return version + 1
+
+    def get(self, poll_id: int) -> tuple[str, list] | None:
+        key = (poll_id, self.version(poll_id))
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] >= self.ttl:
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1:]
+
+    def put(self, poll_id: int, version: int, text: str, options: list) -> None:
+        """
+        Кладет рендер под версию, снятую до чтения из БД. Если опрос успел измениться,
+        пока шло чтение, рендер может быть устаревшим и не сохраняется.
+        """
+        if version != self.version(poll_id):
+            return
+        key = (poll_id, version)
+        self._entries[key] = (time.monotonic(), text, options)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+poll_cache = PollRenderCache(maxsize=POLL_CACHE_SIZE, ttl_seconds=POLL_CACHE_TTL_SECONDS)
@@ -0,0 +1,54 @@
+# KorpBot/poll_cache_sync.py
+
+import logging
+
+from database.main import engine
+from poll_cache import poll_cache
+from poll_state import POLL_CHANGES_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+
+class PollCacheSync:
+    """
+    Инвалидация poll_cache изменениями из других процессов (API, второй экземпляр бота).
+    Процесс держит одну подписку LISTEN на канал poll_changes и по каждому уведомлению
+    увеличивает локальную версию опроса, поэтому устаревший рендер больше не находится.
+    Свои изменения тоже приходят в канал — это лишь один лишний промах кэша.
+    Без подписки (не Postgres, обрыв соединения) устаревание ограничивает TTL кэша.
+    """
+
+    def __init__(self):
+        self._connection = None
+
+    async def start(self) -> None:
+        if self._connection is not None:
+            return
+        connection = await engine.connect()
+        try:
+            raw = await connection.get_raw_connection()
+            await raw.driver_connection.add_listener(POLL_CHANGES_CHANNEL, self._on_notify)
+            raw.driver_connection.add_termination_listener(self._on_terminate)
+        except Exception as e:
+            logger.warning(f"Подписка на изменения опросов недоступна, кэш обновляется по TTL: {e}")
+            await connection.close()
+            return
+        self._connection = connection
+
+    async def close(self) -> None:
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        try:
+            poll_cache.bump(int(payload))
+        except ValueError:
+            logger.warning(f"Некорректное уведомление в канале {channel}: {payload!r}")
+
+    def _on_terminate(self, connection) -> None:
+        logger.warning("Подписка на изменения опросов потеряна, кэш обновляется по TTL до перезапуска.")
+        self._connection = None
+
+
+poll_cache_sync = PollCacheSync()
@@ -0,0 +1,76 @@
+# KorpBot/poll_catalogue.py
+
+import asyncio
+import time
+
+from aiogram.types import InlineKeyboardMarkup
+from sqlalchemy import select
+
+from config import POLL_CATALOGUE_TTL_SECONDS
+from database.main import mark_written, read_session
+from database.models import Poll, PollOption
+from keyboards import create_poll_choice_keyboard, create_voting_keyboard
+
+# Ключ read-your-writes для списка активных опросов (см. database.main.read_session)
+CATALOGUE_READ_KEY = "poll_catalogue"
+
+# Активные опросы для клавиатуры /poll, новые первыми
+ACTIVE_POLLS_QUERY = select(Poll.id, Poll.title).filter_by(status=True).order_by(Poll.created_at.desc())
+
+
+class ActivePollCatalogue:
+    """
+    Каталог активных опросов в памяти процесса с готовыми клавиатурами.
+    /poll и открытие опроса после анонса приходят тысячами, а список активных
+    опросов и их варианты меняются редко: клавиатуры строятся один раз и
+    переиспользуются. Свои изменения сбрасывают каталог сразу (invalidate),
+    изменения из других процессов подхватываются не позже чем через ttl_seconds.
+    """
+
+    def __init__(self, ttl_seconds: float = 30.0):
+        self.ttl = ttl_seconds
+        self._choice_keyboard: InlineKeyboardMarkup | None = None
+        self._voting_keyboards: dict[int, InlineKeyboardMarkup] = {}
+        self._loaded_at: float | None = None
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        """Сбрасывает каталог: следующий /poll перечитает активные опросы из БД."""
+        self._loaded_at = None
+        # Перечитывать будем с основной БД: реплика может еще не знать о новом опросе
+        mark_written(CATALOGUE_READ_KEY)
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def choice_keyboard(self) -> InlineKeyboardMarkup | None:
+        """Клавиатура выбора опроса для /poll или None, если активных опросов нет."""
+        if not self._is_fresh():
+            # Одновременные /poll после сброса ждут одно общее чтение из БД
+            async with self._lock:
+                if not self._is_fresh():
+                    await self._reload()
+        return self._choice_keyboard
+
+    def voting_keyboard(self, poll_id: int, options: list[PollOption]) -> InlineKeyboardMarkup:
+        """Клавиатура голосования опроса; варианты после создания не меняются, поэтому строится один раз."""
+        keyboard = self._voting_keyboards.get(poll_id)
+        if keyboard is None:
+            keyboard = create_voting_keyboard(options)
+            self._voting_keyboards[poll_id] = keyboard
+        return keyboard
+
+    async def _reload(self) -> None:
+        async with read_session(CATALOGUE_READ_KEY) as session:
+            result = await session.execute(ACTIVE_POLLS_QUERY)
+            active_polls = result.all()
+        self._choice_keyboard = create_poll_choice_keyboard(active_polls) if active_polls else None
+        # Клавиатуры голосования держим только для активных опросов: удаленные и завершенные выпадают
+        active_ids = {poll.id for poll in active_polls}
+        self._voting_keyboards = {
+            poll_id: keyboard for poll_id, keyboard in self._voting_keyboards.items() if poll_id in active_ids
+        }
+        self._loaded_at = time.monotonic()
+
+
+poll_catalogue = ActivePollCatalogue(ttl_seconds=POLL_CATALOGUE_TTL_SECONDS)
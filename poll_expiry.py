@@ -0,0 +1,169 @@
+# KorpBot/poll_expiry.py
+
+import asyncio
+import heapq
+import logging
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from sqlalchemy import select
+
+from broadcast import broadcaster
+from database.main import async_session, engine
+from database.models import Poll, PollSnapshot, TelegramPoll
+from poll_catalogue import poll_catalogue
+from poll_state import POLL_DEADLINES_CHANNEL, set_poll_status
+
+logger = logging.getLogger(__name__)
+
+
+class PollExpiryScheduler:
+    """
+    Автоматическое завершение опросов по сроку (Poll.closes_at).
+    Ближайшие сроки лежат в min-куче, и задача спит ровно до первого из них,
+    не опрашивая БД. При старте куча собирается одним запросом, о новых сроках
+    из других процессов (например, из API) сообщает канал LISTEN poll_deadlines.
+    В срок опрос завершается, а его сообщения с кнопками заменяются итогами.
+    """
+
+    def __init__(self):
+        self._heap: list[tuple[datetime, int]] = []
+        # Актуальный срок каждого опроса; записи кучи с другим сроком устарели
+        self._deadlines: dict[int, datetime] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        # Фоновые правки сообщений завершенных опросов и загрузки сроков по уведомлениям:
+        # ссылки не дают сборщику мусора их потерять, close() их дожидается
+        self._background: set[asyncio.Task] = set()
+        self._connection = None
+        self._bot: Bot | None = None
+
+    async def start(self, bot: Bot) -> None:
+        self._bot = bot
+        async with async_session() as session:
+            result = await session.execute(
+                select(Poll.id, Poll.closes_at).filter(Poll.status.is_(True), Poll.closes_at.is_not(None))
+            )
+            for poll_id, closes_at in result:
+                self.schedule(poll_id, closes_at)
+        await self._listen()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Планировщик сроков опросов запущен, ожидают завершения: {len(self._deadlines)}.")
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.gather(*self._background, return_exceptions=True)
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    def schedule(self, poll_id: int, closes_at: datetime) -> None:
+        """Ставит (или переносит) срок завершения опроса."""
+        if self._deadlines.get(poll_id) == closes_at:
+            return
+        self._deadlines[poll_id] = closes_at
+        heapq.heappush(self._heap, (closes_at, poll_id))
+        if self._heap[0] == (closes_at, poll_id):
+            # Новый срок раньше того, до которого спит задача
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            timeout = (self._heap[0][0] - datetime.now()).total_seconds() if self._heap else None
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            closes_at, poll_id = heapq.heappop(self._heap)
+            if self._deadlines.get(poll_id) != closes_at:
+                continue
+            del self._deadlines[poll_id]
+            try:
+                await self._expire(poll_id)
+            except Exception as e:
+                logger.error(f"Не удалось завершить опрос {poll_id} по сроку: {e}")
+
+    async def _expire(self, poll_id: int) -> None:
+        async with async_session() as session:
+            # Проверка и закрытие под блокировкой строки: ручное завершение в это же время
+            # дождется нас (или мы его) и не закроет опрос второй раз
+            poll = await session.get(Poll, poll_id, with_for_update=True)
+            # Опрос могли удалить, завершить вручную или продлить
+            if not poll or not poll.status or poll.closes_at is None:
+                return
+            if poll.closes_at > datetime.now():
+                self.schedule(poll_id, poll.closes_at)
+                return
+            await set_poll_status(session, poll_id, False)
+            snapshot = await session.get(PollSnapshot, poll_id)
+            result = await session.execute(select(TelegramPoll.telegram_poll_id).filter_by(poll_id=poll_id))
+            messages = result.scalars().all()
+        poll_catalogue.invalidate()
+        logger.info(f"Опрос {poll_id} завершен по сроку, сообщений к обновлению: {len(messages)}.")
+        self._spawn(self._update_messages(f"{snapshot.telegram_text}\n\n🏁 Опрос завершен.", messages))
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background_done)
+
+    def _background_done(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Ошибка фоновой задачи планировщика сроков: {task.exception()!r}")
+
+    async def _update_messages(self, text: str, messages: list[str]) -> None:
+        """Заменяет кнопки опроса итогами; правки идут через общее с рассылками ведро токенов."""
+        for message in messages:
+            chat_id, message_id = map(int, message.split(":"))
+            for _ in range(2):
+                await broadcaster.bucket.acquire()
+                try:
+                    await self._bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id,
+                                                      reply_markup=None, parse_mode="HTML")
+                except TelegramRetryAfter as e:
+                    broadcaster.bucket.pause(e.retry_after)
+                    continue
+                except TelegramBadRequest:
+                    # Сообщение удалено или уже содержит итоги
+                    pass
+                except Exception as e:
+                    logger.warning(f"Не удалось обновить сообщение опроса {message}: {e}")
+                break
+
+    async def _listen(self) -> None:
+        connection = await engine.connect()
+        try:
+            raw = await connection.get_raw_connection()
+            await raw.driver_connection.add_listener(POLL_DEADLINES_CHANNEL, self._on_notify)
+        except Exception as e:
+            # Например, не Postgres: сроки опросов из других процессов подхватятся после перезапуска
+            logger.warning(f"Подписка на сроки опросов недоступна: {e}")
+            await connection.close()
+            return
+        self._connection = connection
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        try:
+            poll_id = int(payload)
+        except ValueError:
+            logger.warning(f"Некорректное уведомление в канале {channel}: {payload!r}")
+            return
+        self._spawn(self._load_deadline(poll_id))
+
+    async def _load_deadline(self, poll_id: int) -> None:
+        async with async_session() as session:
+            poll = await session.get(Poll, poll_id)
+        if poll and poll.status and poll.closes_at is not None:
+            self.schedule(poll_id, poll.closes_at)
+
+
+poll_expiry = PollExpiryScheduler()
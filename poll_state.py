@@ -1,75 +1,366 @@
 # KorpBot/poll_state.py (ПОЛНАЯ ВЕРСИЯ)
 
+from datetime import datetime
+
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from database.models import PollOption, User, Poll
+from sqlalchemy import delete, func, select, text, update
+from config import VOTE_COUNTER_SHARDS
+from database.main import mark_written
+from database.models import PollOption, Poll, PollSnapshot, TelegramPoll, User
+from poll_cache import poll_cache
+
 
+def render_poll_text(title: str, options: list) -> str:
+    """Собирает HTML-текст с результатами опроса из уже отсортированных вариантов."""
+    total_votes = sum(opt.votes_count for opt in options)
+    text_lines = [f"<b>{title}</b>\n", f"👥 Всего проголосовало: {total_votes}\n"]
+    for option in options:
+        percentage = (option.votes_count / total_votes * 100) if total_votes > 0 else 0
+        text_lines.append(f"▫️ {option.option_text}: {option.votes_count} ({percentage:.1f}%)")
+    return "\n".join(text_lines)
 
-async def start_new_poll(session: AsyncSession, question: str, options: list) -> int:
+
+async def start_new_poll(session: AsyncSession, question: str, options: list,
+                         closes_at: datetime | None = None) -> int:
     """
     Создает новый опрос и добавляет его в базу данных.
+    Если задан closes_at, опрос завершится автоматически в этот момент.
     Возвращает ID созданного опроса.
     """
-    try:
-        new_poll = Poll(title=question)
-        session.add(new_poll)
-        await session.flush()
+    return (await start_new_polls(session, [(question, options, closes_at)]))[0]
 
-        for option_text in options:
-            poll_option = PollOption(poll_id=new_poll.id, option_text=option_text, votes_count=0)
-            session.add(poll_option)
 
+async def start_new_polls(session: AsyncSession, polls: list[tuple[str, list, datetime | None]]) -> list[int]:
+    """
+    Создает опросы (вопрос, варианты, срок) одной транзакцией: опросы и все их варианты
+    вставляются двумя многострочными INSERT ... RETURNING, а не по одному объекту.
+    Возвращает ID созданных опросов в порядке входного списка.
+    """
+    try:
+        # sort_by_parameter_order: ID приходят в порядке строк даже при пакетной вставке
+        poll_ids = (await session.execute(
+            insert(Poll).returning(Poll.id, sort_by_parameter_order=True),
+            [{"title": question, "closes_at": closes_at} for question, _, closes_at in polls],
+        )).scalars().all()
+        await session.execute(insert(PollOption), [
+            {"poll_id": poll_id, "option_text": option_text, "votes_count": 0}
+            for poll_id, (_, options, _) in zip(poll_ids, polls)
+            for option_text in options
+        ])
+
+        await notify_poll_deadlines(session, [
+            poll_id for poll_id, (_, _, closes_at) in zip(poll_ids, polls) if closes_at is not None
+        ])
         await session.commit()
-        return new_poll.id
+        return list(poll_ids)
     except Exception as e:
         await session.rollback()
         print(f"Ошибка при создании опроса: {e}")
         raise
 
 
-async def record_vote(session: AsyncSession, poll_id: int, option_id: int, user_tg_id: int, user_full_name: str):
+# Канал Postgres LISTEN/NOTIFY, в который пишется ID опроса после каждого изменения
+# голосов или статуса; на него подписаны живые веб-отчеты (api/live.py)
+POLL_CHANGES_CHANNEL = "poll_changes"
+
+NOTIFY_POLLS_SQL = text(
+    "SELECT pg_notify(:channel, CAST(p AS TEXT)) FROM unnest(CAST(:poll_ids AS INTEGER[])) AS p"
+)
+
+
+# Канал, в который пишется ID опроса со сроком завершения; его слушает
+# планировщик poll_expiry.py в процессе бота, даже если опрос создан через API
+POLL_DEADLINES_CHANNEL = "poll_deadlines"
+
+
+async def notify_poll_deadlines(session: AsyncSession, poll_ids) -> None:
+    """Сообщает планировщику о сроках опросов (доставляется после commit)."""
+    poll_ids = sorted(set(poll_ids))
+    if poll_ids:
+        await session.execute(NOTIFY_POLLS_SQL, {"channel": POLL_DEADLINES_CHANNEL, "poll_ids": poll_ids})
+
+
+async def remember_poll_messages(session: AsyncSession, poll_id: int, messages: list[tuple[int, int]]) -> None:
+    """
+    Запоминает сообщения (chat_id, message_id) с кнопками опроса в telegram_poll,
+    чтобы по завершении опроса заменить их итогами.
+    """
+    if not messages:
+        return
+    statement = insert(TelegramPoll).values([
+        {"telegram_poll_id": f"{chat_id}:{message_id}", "poll_id": poll_id} for chat_id, message_id in messages
+    ])
+    await session.execute(statement.on_conflict_do_nothing(index_elements=[TelegramPoll.telegram_poll_id]))
+    await session.commit()
+
+
+async def notify_poll_changed(session: AsyncSession, poll_ids) -> None:
+    """
+    Ставит уведомление об изменении опросов в текущую транзакцию.
+    Postgres доставит его подписчикам только после commit.
+    """
+    poll_ids = sorted(set(poll_ids))
+    if poll_ids:
+        await session.execute(NOTIFY_POLLS_SQL, {"channel": POLL_CHANGES_CHANNEL, "poll_ids": poll_ids})
+
+
+async def get_poll_tallies(session: AsyncSession, poll_id: int) -> list:
+    """Итоги опроса по вариантам одним GROUP BY: строки (option_id, option_text, votes)."""
+    return (await get_polls_tallies(session, [poll_id])).get(poll_id, [])
+
+
+async def get_polls_tallies(session: AsyncSession, poll_ids: list[int]) -> dict[int, list]:
+    """
+    Итоги нескольких опросов одним GROUP BY: {poll_id: [(option_id, option_text, votes), ...]}.
+    К голосам из таблицы user прибавляются импортированные без проголосовавших (imported_votes).
+    """
+    query = (
+        select(PollOption.poll_id, PollOption.id.label("option_id"), PollOption.option_text,
+               (func.count(User.id) + PollOption.imported_votes).label("votes"))
+        .outerjoin(User, User.option_id == PollOption.id)
+        .filter(PollOption.poll_id.in_(poll_ids))
+        .group_by(PollOption.id)
+        .order_by(PollOption.id)
+    )
+    tallies: dict[int, list] = {}
+    for row in await session.execute(query):
+        tallies.setdefault(row.poll_id, []).append(row)
+    return tallies
+
+
+async def bump_poll_versions(session: AsyncSession, poll_ids) -> bool:
     """
-    Сохраняет голос пользователя за конкретный вариант опроса.
-    Если пользователь уже голосовал — обновляет его голос и ФИО.
+    Увеличивает Poll.version (ETag и кэши отчетов) опросов, в которые записаны голоса.
+    Вызывается после commit голосов отдельной короткой транзакцией: строка опроса
+    не пишется в каждой транзакции голосов. Блокировка FOR NO KEY UPDATE в порядке id
+    не конфликтует с голосами (FOR KEY SHARE). Возвращает False при ошибке: голоса
+    уже записаны, и вызывающий должен повторить увеличение версий позже.
     """
+    poll_ids = sorted(set(poll_ids))
+    if not poll_ids:
+        return True
     try:
-        existing_vote = await session.execute(
-            select(User).filter_by(poll_id=poll_id, user_tg_id=user_tg_id)
+        await session.execute(
+            select(Poll.id).filter(Poll.id.in_(poll_ids)).order_by(Poll.id).with_for_update(key_share=True)
         )
-        user_vote = existing_vote.scalars().first()
+        await session.execute(update(Poll).where(Poll.id.in_(poll_ids)).values(version=Poll.version + 1))
+        await session.commit()
+        return True
+    except Exception as e:
+        await session.rollback()
+        print(f"Ошибка при обновлении версий опросов {poll_ids}: {e}")
+        return False
+
+
+# Сколько раз повторяется пачка голосов, столкнувшаяся с параллельной первой вставкой (lost ниже)
+VOTE_RETRIES = 3
+
+
+# Запись голосов очереди (vote_queue.py) одним запросом на пачку: upsert участников
+# по уникальной паре (poll_id, user_tg_id) и корректировка счетчиков прямо в SQL.
+# Входные голоса передаются массивами; при нескольких голосах одного
+# пользователя в одном опросе побеждает последний (DISTINCT ON по порядку).
+# Счетчики меняются одной агрегированной дельтой на вариант ответа.
+# Голоса принимаются только в активных опросах. Строки опросов берутся FOR KEY SHARE
+# в порядке id: голоса не мешают друг другу и обновлению версии опроса, а закрытие
+# опроса (set_polls_status, FOR UPDATE) ждет уже начатые голоса и не пропускает новые.
+# Если первый голос пользователя одновременно вставила другая транзакция, ON CONFLICT
+# дождется ее и обновит строку, которой нет в снимке: prev пуст, счетчики не сдвинуты.
+# Такие голоса помечаются lost, и пачка повторяется целиком в новой транзакции.
+# Poll.version голоса не трогают: ее увеличивает bump_poll_versions уже после commit.
+_RECORD_VOTES_BATCH_CTES = """
+WITH input AS (
+    SELECT * FROM unnest(
+        CAST(:option_ids AS INTEGER[]), CAST(:user_tg_ids AS BIGINT[]), CAST(:user_full_names AS TEXT[])
+    ) WITH ORDINALITY AS t(option_id, user_tg_id, user_full_name, seq)
+),
+opts AS (
+    SELECT po.id AS option_id, po.poll_id
+    FROM poll_option po JOIN poll p ON p.id = po.poll_id
+    WHERE po.id IN (SELECT option_id FROM input) AND p.status
+    ORDER BY p.id
+    FOR KEY SHARE OF p
+),
+v AS (
+    SELECT DISTINCT ON (opts.poll_id, i.user_tg_id)
+           opts.poll_id, i.option_id, i.user_tg_id, i.user_full_name
+    FROM input i JOIN opts ON opts.option_id = i.option_id
+    ORDER BY opts.poll_id, i.user_tg_id, i.seq DESC
+),
+prev AS (
+    SELECT u.poll_id, u.user_tg_id, u.option_id FROM "user" u
+    JOIN v ON v.poll_id = u.poll_id AND v.user_tg_id = u.user_tg_id
+    FOR UPDATE OF u
+),
+up AS (
+    INSERT INTO "user" (poll_id, user_tg_id, option_id, user_full_name, voted_at)
+    SELECT poll_id, user_tg_id, option_id, user_full_name, LOCALTIMESTAMP FROM v
+    ON CONFLICT (poll_id, user_tg_id) DO UPDATE
+        SET option_id = EXCLUDED.option_id, user_full_name = EXCLUDED.user_full_name,
+            voted_at = EXCLUDED.voted_at
+    RETURNING poll_id, user_tg_id, option_id, (xmax = 0) AS inserted
+),
+moves AS (
+    SELECT up.poll_id, up.user_tg_id, up.option_id, 1 AS d FROM up
+    LEFT JOIN prev ON prev.poll_id = up.poll_id AND prev.user_tg_id = up.user_tg_id
+    WHERE up.inserted OR prev.option_id <> up.option_id
+    UNION ALL
+    SELECT up.poll_id, up.user_tg_id, prev.option_id, -1 AS d FROM up
+    JOIN prev ON prev.poll_id = up.poll_id AND prev.user_tg_id = up.user_tg_id
+    WHERE NOT up.inserted AND prev.option_id <> up.option_id
+),
+lost AS (
+    SELECT 1 FROM up
+    LEFT JOIN prev ON prev.poll_id = up.poll_id AND prev.user_tg_id = up.user_tg_id
+    WHERE NOT up.inserted AND prev.user_tg_id IS NULL
+)"""
 
-        if user_vote:
-            # Обновляем имя на случай, если пользователь его сменил
-            user_vote.user_full_name = user_full_name
+RECORD_VOTES_BATCH_SQL = text(_RECORD_VOTES_BATCH_CTES + """,
+delta AS (
+    SELECT option_id, SUM(d) AS d FROM moves GROUP BY option_id HAVING SUM(d) <> 0
+),
+upd AS (
+    UPDATE poll_option po SET votes_count = GREATEST(po.votes_count + delta.d, 0)
+    FROM delta WHERE po.id = delta.option_id
+    RETURNING po.id
+)
+SELECT option_id, poll_id, EXISTS (SELECT 1 FROM lost) AS lost FROM opts
+""")
 
-            # Если пользователь сменил голос
-            if user_vote.option_id != option_id:
-                old_option = await session.get(PollOption, user_vote.option_id)
-                if old_option and old_option.votes_count > 0:
-                    old_option.votes_count -= 1
+# Режим шардированных счетчиков (VOTE_COUNTER_SHARDS): дельта пишется не в единственную
+# строку poll_option, а в один из :shards слотов poll_option_counter, выбранный по
+# user_tg_id, поэтому одновременные голоса за один вариант не ждут одну блокировку.
+# Poll.version здесь не растет — вместо нее меняется poll_option_counter.changes
+# (см. vote_counters.py).
+RECORD_VOTES_BATCH_SHARDED_SQL = text(_RECORD_VOTES_BATCH_CTES + """,
+delta AS (
+    SELECT poll_id, option_id, CAST(user_tg_id % :shards AS SMALLINT) AS slot, SUM(d) AS d, COUNT(*) AS changes
+    FROM moves GROUP BY poll_id, option_id, slot
+),
+upd AS (
+    INSERT INTO poll_option_counter (option_id, slot, poll_id, votes, changes)
+    SELECT option_id, slot, poll_id, d, changes FROM delta ORDER BY option_id, slot
+    ON CONFLICT (option_id, slot) DO UPDATE
+        SET votes = poll_option_counter.votes + EXCLUDED.votes,
+            changes = poll_option_counter.changes + EXCLUDED.changes
+)
+SELECT option_id, poll_id, EXISTS (SELECT 1 FROM lost) AS lost FROM opts
+""")
 
-                new_option = await session.get(PollOption, option_id)
-                if new_option:
-                    new_option.votes_count += 1
 
-                user_vote.option_id = option_id
+async def record_votes_batch(session: AsyncSession, votes: list[tuple[int, int, str]]) -> dict[int, int]:
+    """
+    Сохраняет пачку голосов (option_id, user_tg_id, user_full_name) в одной транзакции.
+    Возвращает соответствие option_id -> poll_id для вариантов, которые еще существуют
+    и принадлежат активным опросам.
+    """
+    params = {
+        "option_ids": [vote[0] for vote in votes],
+        "user_tg_ids": [vote[1] for vote in votes],
+        "user_full_names": [vote[2] for vote in votes],
+    }
+    statement = RECORD_VOTES_BATCH_SQL
+    if VOTE_COUNTER_SHARDS > 1:
+        statement = RECORD_VOTES_BATCH_SHARDED_SQL
+        params["shards"] = VOTE_COUNTER_SHARDS
+    try:
+        for _ in range(VOTE_RETRIES):
+            rows = (await session.execute(statement, params)).all()
+            if not any(row.lost for row in rows):
+                break
+            # Первый голос пользователя параллельно вставила другая транзакция: после
+            # отката новый снимок увидит ее строку, и голос переключится как обычно
+            await session.rollback()
         else:
-            # Создаем новую запись о голосе, включая ФИО
-            new_vote = User(
-                poll_id=poll_id,
-                user_tg_id=user_tg_id,
-                option_id=option_id,
-                user_full_name=user_full_name
-            )
-            session.add(new_vote)
-
-            # Увеличиваем счетчик голосов
-            option = await session.get(PollOption, option_id)
-            if option:
-                option.votes_count += 1
+            raise RuntimeError(f"Пачку голосов не удалось записать за {VOTE_RETRIES} попытки.")
+        poll_ids = {row.option_id: row.poll_id for row in rows}
+        await notify_poll_changed(session, poll_ids.values())
+        await session.commit()
+    except Exception as e:
+        await session.rollback()
+        print(f"Ошибка при сохранении пачки голосов: {e}")
+        raise
 
+    for poll_id in set(poll_ids.values()):
+        poll_cache.bump(poll_id)
+        mark_written(poll_id)
+    return poll_ids
+
+
+def snapshot_options(snapshot: PollSnapshot) -> list[PollOption]:
+    """Варианты из снимка в виде (не привязанных к сессии) объектов PollOption."""
+    return [
+        PollOption(id=option["id"], poll_id=snapshot.poll_id, option_text=option["option_text"],
+                   votes_count=option["votes_count"])
+        for option in snapshot.options
+    ]
+
+
+async def set_poll_status(session: AsyncSession, poll_id: int, status: bool):
+    """
+    Активирует или завершает опрос. При завершении итоги замораживаются в poll_snapshot
+    в той же транзакции, при повторной активации снимок и срок опроса удаляются.
+    Возвращает строку (id, title, status, version) или None, если опроса нет.
+    """
+    polls = await set_polls_status(session, [poll_id], status)
+    return polls[0] if polls else None
+
+
+async def set_polls_status(session: AsyncSession, poll_ids: list[int], status: bool) -> list:
+    """
+    Активирует или завершает набор опросов одним UPDATE; снимки итогов пишутся
+    и удаляются тоже пачкой, все в одной транзакции.
+    Возвращает строки (id, title, status, version) найденных опросов.
+    """
+    poll_ids = sorted(set(poll_ids))
+    if not poll_ids:
+        return []
+    try:
+        # Строки опросов сначала блокируются в порядке id: иначе UPDATE берет блокировки
+        # в порядке плана, и две пачки с пересекающимися опросами могут взаимоблокироваться.
+        # Голоса держат опрос FOR KEY SHARE, а с ней конфликтует только FOR UPDATE: блокировка
+        # дожидается уже начатых голосов, новые ждут commit и видят новый статус. Итоги для
+        # снимка читаются после нее и поэтому учитывают все принятые голоса
+        await session.execute(select(Poll.id).filter(Poll.id.in_(poll_ids)).order_by(Poll.id).with_for_update())
+        values = {"status": status, "version": Poll.version + 1}
+        if status:
+            # Прошедший срок иначе сразу завершил бы опрос снова
+            values["closes_at"] = None
+        polls = (await session.execute(
+            update(Poll).where(Poll.id.in_(poll_ids)).values(**values)
+            .returning(Poll.id, Poll.title, Poll.status, Poll.version)
+        )).all()
+        if not polls:
+            await session.rollback()
+            return []
+        updated_ids = [poll.id for poll in polls]
+
+        await session.execute(delete(PollSnapshot).where(PollSnapshot.poll_id.in_(updated_ids)))
+        if not status:
+            tallies = await get_polls_tallies(session, updated_ids)
+            for poll in polls:
+                options = [
+                    PollOption(id=row.option_id, poll_id=poll.id, option_text=row.option_text, votes_count=row.votes)
+                    for row in tallies.get(poll.id, [])
+                ]
+                session.add(PollSnapshot(
+                    poll_id=poll.id,
+                    title=poll.title,
+                    version=poll.version,
+                    total_voters=sum(o.votes_count for o in options),
+                    options=[{"id": o.id, "option_text": o.option_text, "votes_count": o.votes_count}
+                             for o in options],
+                    telegram_text=render_poll_text(poll.title, options),
+                ))
+        await notify_poll_changed(session, updated_ids)
         await session.commit()
     except Exception as e:
         await session.rollback()
-        print(f"Ошибка при сохранении голоса: {e}")
-        raise
\ No newline at end of file
+        print(f"Ошибка при изменении статуса опроса: {e}")
+        raise
+
+    for poll_id in updated_ids:
+        poll_cache.bump(poll_id)
+        mark_written(poll_id)
+    return polls
\ No newline at end of file
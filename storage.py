@@ -1,28 +1,183 @@
+import atexit
 import json
 import os
+import threading
 
+# Старый формат: весь список опросов одним JSON; теперь только читается при миграции
 DATA_FILE = "polls.json"
+# Журнал: одна JSON-строка на операцию, файл только дописывается
+LOG_FILE = "polls.jsonl"
+# fsync не на каждую запись, а раз в FSYNC_EVERY записей или не позже чем через
+# FSYNC_INTERVAL секунд после первой несинхронизированной записи (по таймеру)
+FSYNC_EVERY = 32
+FSYNC_INTERVAL = 1.0
+# Сжатие журнала, когда устаревших записей (перезаписанных голосов) накопилось больше этого
+COMPACT_AFTER = 1000
+
+
+def _fsync_dir(path):
+    """После os.replace синхронизируем каталог, чтобы новое имя файла пережило сбой питания."""
+    if os.name != "nt":
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def replay(lines):
+    """
+    Восстанавливает список опросов из строк журнала.
+    Оборванной может быть только последняя строка (сбой посреди записи) — она пропускается.
+    Неразборчивая строка в середине журнала означает порчу файла: ValueError с ее номером.
+    Возвращает (опросы, число устаревших записей, была ли последняя строка оборвана).
+    """
+    numbered = [(number, line.strip()) for number, line in enumerate(lines, 1) if line.strip()]
+    polls = []
+    stale = 0
+    torn = False
+    for index, (number, line) in enumerate(numbered):
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            if index < len(numbered) - 1:
+                raise ValueError(f"Журнал опросов поврежден: строка {number} не читается ({e}).") from e
+            torn = True
+            continue
+        if record.get("op") == "poll":
+            polls.append(record["poll"])
+        elif record.get("op") == "votes" and polls:
+            if "votes" in polls[-1]:
+                stale += 1
+            polls[-1]["votes"] = record["votes"]
+    return polls, stale, torn
+
+
+class PollLog:
+    """
+    Журнал опросов только на дозапись (JSON Lines): добавление опроса и обновление
+    голосов стоят O(1), а сбой посреди записи портит не больше одной последней строки.
+    Текущее состояние держится в памяти; журнал периодически сжимается до одной
+    записи на опрос через временный файл и атомарный os.replace.
+    Дописанные строки уходят на диск пачкой из FSYNC_EVERY записей, а неполную пачку
+    сбрасывает таймер через FSYNC_INTERVAL секунд, даже если новых записей больше нет.
+    """
+
+    def __init__(self, path=LOG_FILE, legacy_path=DATA_FILE):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._polls = None
+        self._stale = 0
+        self._file = None
+        self._unsynced = 0
+        self._timer = None
+        # Таймер синхронизирует файл из своего потока
+        self._lock = threading.RLock()
+
+    def _load(self):
+        if self._polls is not None:
+            return
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                content = f.read()
+            self._polls, self._stale, torn = replay(content.splitlines())
+            if torn or (content and not content.endswith("\n")):
+                # Хвост оборванной записи: иначе следующая строка приклеится к нему,
+                # а сам он окажется в середине журнала
+                self.compact()
+        elif os.path.exists(self.legacy_path):
+            # Первый запуск после перехода: переносим polls.json в журнал одним сжатием
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                self._polls = json.load(f)
+            self.compact()
+        else:
+            self._polls = []
+
+    def _append(self, record):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self._unsynced += 1
+            if self._unsynced >= FSYNC_EVERY:
+                self.sync()
+            elif self._timer is None:
+                self._timer = threading.Timer(FSYNC_INTERVAL, self.sync)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def sync(self):
+        """Сбрасывает на диск все дописанные строки."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._file is not None and self._unsynced:
+                os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def close(self):
+        """Сбрасывает хвост журнала на диск и закрывает файл."""
+        with self._lock:
+            self.sync()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def compact(self):
+        """Переписывает журнал по одной записи на опрос; старый файл заменяется атомарно."""
+        self.close()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for poll in self._polls:
+                f.write(json.dumps({"op": "poll", "poll": poll}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        _fsync_dir(self.path)
+        self._stale = 0
+
+    def load_polls(self):
+        self._load()
+        return [dict(poll) for poll in self._polls]
+
+    def save_poll(self, poll):
+        self._load()
+        self._polls.append(dict(poll))
+        self._append({"op": "poll", "poll": poll})
+
+    def update_last_poll_votes(self, votes):
+        self._load()
+        if not self._polls:
+            return
+        if "votes" in self._polls[-1]:
+            self._stale += 1
+        self._polls[-1]["votes"] = votes
+        self._append({"op": "votes", "votes": votes})
+        if self._stale > COMPACT_AFTER:
+            self.compact()
+
+
+_log = PollLog()
+# Хвост журнала, еще не прошедший fsync, сбрасывается и при обычном выходе
+atexit.register(_log.close)
 
 
 def load_polls():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
+    return _log.load_polls()
 
 
 def save_poll(poll):
-    """Добавляет опрос в файл"""
-    polls = load_polls()
-    polls.append(poll)
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(polls, f, ensure_ascii=False, indent=4)
+    """Добавляет опрос в журнал"""
+    _log.save_poll(poll)
 
 
 def update_last_poll_votes(votes):
     """Обновляет голоса последнего опроса"""
-    polls = load_polls()
-    if polls:
-        polls[-1]["votes"] = votes
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(polls, f, ensure_ascii=False, indent=4)
+    _log.update_last_poll_votes(votes)
+
+
+def close():
+    """Сбрасывает на диск хвост журнала (вызывать при остановке)."""
+    _log.close()
@@ -0,0 +1,29 @@
+# KorpBot/tests/conftest.py
+
+import asyncio
+import os
+import sys
+import tempfile
+
+# Модули бота читают окружение при импорте: тесты работают на временной SQLite
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/korpbot_test.db")
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+
+import pytest
+
+
+@pytest.fixture
+def db():
+    """Пустая схема БД (как после миграций) на каждый тест."""
+    from database.main import engine
+    from database.models import Base
+
+    async def recreate():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.drop_all)
+            await connection.run_sync(Base.metadata.create_all)
+
+    asyncio.run(recreate())
+    yield
+    asyncio.run(engine.dispose())
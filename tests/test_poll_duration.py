@@ -0,0 +1,49 @@
+# KorpBot/tests/test_poll_duration.py
+
+import asyncio
+
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from pydantic import ValidationError
+
+from api.routes import PollIn
+from commands import PollCreation, newpoll_get_duration
+from config import MAX_POLL_DURATION_HOURS
+
+
+def test_api_rejects_duration_beyond_limit():
+    with pytest.raises(ValidationError):
+        PollIn(title="Q", options=["a", "b"], duration_minutes=10 ** 18)
+    with pytest.raises(ValidationError):
+        PollIn(title="Q", options=["a", "b"], duration_minutes=MAX_POLL_DURATION_HOURS * 60 + 1)
+
+
+def test_api_accepts_duration_at_limit():
+    poll = PollIn(title="Q", options=["a", "b"], duration_minutes=MAX_POLL_DURATION_HOURS * 60)
+    assert poll.duration_minutes == MAX_POLL_DURATION_HOURS * 60
+
+
+class FakeMessage:
+    def __init__(self, text: str):
+        self.text = text
+        self.answers = []
+
+    async def answer(self, text: str, **kwargs):
+        self.answers.append(text)
+
+
+@pytest.mark.parametrize("text", ["inf", "nan", "-1", "abc", str(MAX_POLL_DURATION_HOURS + 1), "1e300"])
+def test_newpoll_rejects_invalid_duration(text):
+    async def run():
+        state = FSMContext(MemoryStorage(), StorageKey(bot_id=1, chat_id=1, user_id=1))
+        await state.set_state(PollCreation.waiting_for_duration)
+        message = FakeMessage(text)
+        await newpoll_get_duration(message, state)
+        return message.answers, await state.get_state()
+
+    answers, current_state = asyncio.run(run())
+    assert answers == ["Нужно неотрицательное число часов. Попробуйте еще раз."]
+    # Администратор остается на шаге ввода срока
+    assert current_state == PollCreation.waiting_for_duration.state
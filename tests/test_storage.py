@@ -0,0 +1,59 @@
+# KorpBot/tests/test_storage.py
+
+import json
+import time
+
+import pytest
+
+import storage
+from storage import PollLog, replay
+
+
+def lines(*records):
+    return [json.dumps(record, ensure_ascii=False) for record in records]
+
+
+def test_replay_skips_torn_last_line():
+    log = lines({"op": "poll", "poll": {"question": "Q"}}, {"op": "votes", "votes": {"a": 1}})
+    polls, stale, torn = replay(log + ['{"op": "votes", "vo'])
+    assert polls == [{"question": "Q", "votes": {"a": 1}}]
+    assert stale == 0
+    assert torn is True
+
+
+def test_replay_counts_overwritten_votes():
+    log = lines({"op": "poll", "poll": {}}, {"op": "votes", "votes": {"a": 1}}, {"op": "votes", "votes": {"a": 2}})
+    polls, stale, torn = replay(log)
+    assert polls == [{"votes": {"a": 2}}]
+    assert (stale, torn) == (1, False)
+
+
+def test_replay_rejects_corrupted_middle_line():
+    log = lines({"op": "poll", "poll": {}}) + ["{oops"] + lines({"op": "votes", "votes": {}})
+    with pytest.raises(ValueError, match="строка 2"):
+        replay(log)
+
+
+def test_load_compacts_torn_tail_before_appending(tmp_path):
+    path = tmp_path / "polls.jsonl"
+    path.write_text("\n".join(lines({"op": "poll", "poll": {"question": "Q"}})) + '\n{"op": "po', encoding="utf-8")
+    log = PollLog(str(path), str(tmp_path / "polls.json"))
+    log.update_last_poll_votes({"a": 1})
+    log.close()
+    # Оборванный хвост убран, новая запись не приклеилась к нему
+    assert PollLog(str(path), str(tmp_path / "polls.json")).load_polls() == [{"question": "Q", "votes": {"a": 1}}]
+
+
+def test_partial_batch_is_synced_by_timer(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(storage, "FSYNC_INTERVAL", 0.01)
+    monkeypatch.setattr(storage.os, "fsync", synced.append)
+    log = PollLog(str(tmp_path / "polls.jsonl"), str(tmp_path / "polls.json"))
+    log.save_poll({"question": "Q"})
+    # Новых записей нет: пачку из одной строки сбрасывает таймер
+    deadline = time.monotonic() + 2
+    while not synced and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(synced) == 1
+    log.close()
+    assert log._timer is None
@@ -0,0 +1,65 @@
+# KorpBot/tests/test_vote_counters.py
+
+import asyncio
+
+from sqlalchemy import select
+
+import vote_counters
+from database.main import async_session
+from database.models import Poll, PollOption, User
+from poll_state import get_polls_tallies
+
+
+async def _noop_notify(session, poll_ids):
+    # pg_notify есть только в Postgres
+    pass
+
+
+async def create_poll(imported_votes: int, stored: int, voters: int) -> tuple[int, int]:
+    async with async_session() as session:
+        poll = Poll(title="Импорт", status=True)
+        session.add(poll)
+        await session.flush()
+        option = PollOption(poll_id=poll.id, option_text="a", votes_count=stored, imported_votes=imported_votes)
+        session.add(option)
+        await session.flush()
+        session.add_all([
+            User(poll_id=poll.id, user_tg_id=1000 + i, option_id=option.id, user_full_name=f"u{i}")
+            for i in range(voters)
+        ])
+        await session.commit()
+        return poll.id, option.id
+
+
+async def votes_count(option_id: int) -> int:
+    async with async_session() as session:
+        return await session.scalar(select(PollOption.votes_count).filter_by(id=option_id))
+
+
+def test_reconcile_keeps_imported_votes(db, monkeypatch):
+    monkeypatch.setattr(vote_counters, "notify_poll_changed", _noop_notify)
+
+    async def run():
+        poll_id, option_id = await create_poll(imported_votes=7, stored=9, voters=2)
+        fixed = await vote_counters.reconcile_vote_counters()
+        async with async_session() as session:
+            tallies = await get_polls_tallies(session, [poll_id])
+        return fixed, await votes_count(option_id), [row.votes for row in tallies[poll_id]]
+
+    fixed, stored, tallies = asyncio.run(run())
+    assert fixed == []
+    assert stored == 9
+    assert tallies == [9]
+
+
+def test_reconcile_fixes_drift_on_top_of_imported_votes(db, monkeypatch):
+    monkeypatch.setattr(vote_counters, "notify_poll_changed", _noop_notify)
+
+    async def run():
+        _, option_id = await create_poll(imported_votes=7, stored=3, voters=2)
+        fixed = await vote_counters.reconcile_vote_counters()
+        return fixed, await votes_count(option_id)
+
+    fixed, stored = asyncio.run(run())
+    assert [(row.stored, row.actual) for row in fixed] == [(3, 9)]
+    assert stored == 9
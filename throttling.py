@@ -0,0 +1,53 @@
+# KorpBot/throttling.py
+
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, TelegramObject
+
+from metrics import BOT_THROTTLED, handler_label
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Анти-флуд для колбэков: не больше limit нажатий за window_seconds
+    на пользователя и префикс кнопки (vote, results, ...).
+    Для каждой пары (пользователь, префикс) хранятся только времена последних
+    limit нажатий (скользящее окно); давно молчавшие пары вытесняются по LRU.
+    Лишние нажатия получают пустой callback.answer и до хэндлеров не доходят.
+    """
+
+    def __init__(self, limits: dict[str, int], window_seconds: float = 10.0, max_tracked: int = 100000):
+        self.limits = limits
+        self.window = window_seconds
+        self.max_tracked = max_tracked
+        self._hits: OrderedDict[tuple[int, str], deque] = OrderedDict()
+
+    async def __call__(self, handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: dict[str, Any]) -> Any:
+        if isinstance(event, CallbackQuery):
+            _, prefix = handler_label(event)
+            limit = self.limits.get(prefix)
+            if limit and not self._allow(event.from_user.id, prefix, limit):
+                BOT_THROTTLED.labels(prefix).inc()
+                await event.answer("Слишком часто. Подождите несколько секунд.")
+                return None
+        return await handler(event, data)
+
+    def _allow(self, user_id: int, prefix: str, limit: int) -> bool:
+        now = time.monotonic()
+        key = (user_id, prefix)
+        hits = self._hits.get(key)
+        if hits is None:
+            hits = self._hits[key] = deque(maxlen=limit)
+            while len(self._hits) > self.max_tracked:
+                self._hits.popitem(last=False)
+        else:
+            self._hits.move_to_end(key)
+        # Окно заполнено, и самое старое нажатие в нем еще не истекло
+        if len(hits) == limit and now - hits[0] < self.window:
+            return False
+        hits.append(now)
+        return True
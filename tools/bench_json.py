@@ -0,0 +1,106 @@
+# KorpBot/tools/bench_json.py
+"""
+Микробенчмарк сериализации JSON-списка опросов: прежний путь (ORM Poll/PollOption
+с selectinload -> Pydantic PollOut с from_attributes -> JSON) против нового
+(простые строки по столбцам -> polls_out за один проход -> orjson).
+
+Создает в базе DATABASE_URL набор тестовых опросов, для каждого размера (--sizes)
+несколько раз строит ответ обоими путями, печатает медианное время и проверяет,
+что тела совпадают. В конце тестовые опросы удаляются (если не указан --keep).
+
+Пример:
+    DATABASE_URL=postgresql+asyncpg://... python -m tools.bench_json --sizes 1000 10000
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List
+
+import orjson
+from pydantic import TypeAdapter
+from sqlalchemy import delete, select
+from sqlalchemy.orm import selectinload
+
+from api.routes import POLL_COLUMNS, PollOut, polls_out
+from database.main import async_session, engine, init_models
+from database.models import Poll, PollOption
+from poll_state import start_new_polls
+
+TITLE_PREFIX = "bench_json"
+CREATE_BATCH = 1000
+
+
+async def create_polls(count: int, options: int) -> list[int]:
+    poll_ids = []
+    async with async_session() as session:
+        for start in range(0, count, CREATE_BATCH):
+            batch = [(f"{TITLE_PREFIX} {i}", [f"Вариант {j + 1}" for j in range(options)], None)
+                     for i in range(start, min(start + CREATE_BATCH, count))]
+            poll_ids += await start_new_polls(session, batch)
+    return poll_ids
+
+
+async def legacy_body(poll_ids: list[int], adapter: TypeAdapter) -> bytes:
+    """Прежний путь: полные ORM-объекты и Pydantic-валидация через атрибуты."""
+    async with async_session() as session:
+        result = await session.execute(
+            select(Poll).options(selectinload(Poll.options)).filter(Poll.id.in_(poll_ids)).order_by(Poll.id.desc())
+        )
+        polls = result.scalars().all()
+        return adapter.dump_json(adapter.validate_python(polls, from_attributes=True))
+
+
+async def fast_body(poll_ids: list[int]) -> bytes:
+    """Новый путь: строки по столбцам, один проход по вариантам и orjson."""
+    async with async_session() as session:
+        result = await session.execute(select(*POLL_COLUMNS).filter(Poll.id.in_(poll_ids)).order_by(Poll.id.desc()))
+        return orjson.dumps(await polls_out(session, result.all()))
+
+
+async def measure(func, *args, repeat: int) -> tuple[float, bytes]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = await func(*args)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), body
+
+
+async def run(args) -> None:
+    await init_models()
+    poll_ids = await create_polls(max(args.sizes), args.options)
+    adapter = TypeAdapter(List[PollOut])
+    try:
+        for size in args.sizes:
+            ids = poll_ids[:size]
+            legacy_time, legacy = await measure(legacy_body, ids, adapter, repeat=args.repeat)
+            fast_time, fast = await measure(fast_body, ids, repeat=args.repeat)
+            same = json.loads(legacy) == json.loads(fast)
+            print(f"{size} опросов x {args.options} вариантов: ORM + Pydantic {legacy_time * 1000:.1f} мс, "
+                  f"строки + orjson {fast_time * 1000:.1f} мс — быстрее в {legacy_time / fast_time:.1f} раза; "
+                  f"тела {'совпадают' if same else 'РАЗЛИЧАЮТСЯ'}")
+    finally:
+        if not args.keep:
+            async with async_session() as session:
+                for start in range(0, len(poll_ids), CREATE_BATCH):
+                    chunk = poll_ids[start:start + CREATE_BATCH]
+                    await session.execute(delete(PollOption).where(PollOption.poll_id.in_(chunk)))
+                    await session.execute(delete(Poll).where(Poll.id.in_(chunk)))
+                await session.commit()
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сравнение сериализации JSON-списка опросов: ORM + Pydantic и строки + orjson.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="сколько опросов в ответе")
+    parser.add_argument("--options", type=int, default=4, help="вариантов ответа в каждом опросе")
+    parser.add_argument("--repeat", type=int, default=5, help="повторов каждого замера (берется медиана)")
+    parser.add_argument("--keep", action="store_true", help="не удалять тестовые опросы после прогона")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
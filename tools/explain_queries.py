@@ -0,0 +1,148 @@
+# KorpBot/tools/explain_queries.py
+"""
+Печатает планы выполнения (EXPLAIN) горячих запросов бота и API на текущей базе
+и отмечает последовательные сканы (Seq Scan) — кандидаты на новый индекс.
+Запросы не выполняются, поэтому скрипт безопасен и для рабочей базы.
+
+Пример:
+    DATABASE_URL=postgresql+asyncpg://... python -m tools.explain_queries
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from sqlalchemy import TextClause, func, inspect, select, text
+
+from api.routes import fetch_polls_page, polls_out, voters_page_query
+from commands import get_poll_text_and_options
+from database.main import engine
+from database.models import Poll, PollOption, TelegramPoll, User
+from poll_catalogue import ACTIVE_POLLS_QUERY
+from poll_state import RECORD_VOTES_BATCH_SHARDED_SQL, get_polls_tallies, record_votes_batch
+from vote_counters import ShardedVoteCounts, mismatch_query
+
+
+class _NoRows:
+    """Пустой результат: функции приложения доходят до конца, ничего не прочитав."""
+
+    def __iter__(self):
+        return iter(())
+
+    def all(self):
+        return []
+
+    def scalars(self):
+        return self
+
+    def scalar(self):
+        return None
+
+    def scalar_one_or_none(self):
+        return None
+
+    def one_or_none(self):
+        return None
+
+
+class StatementRecorder:
+    """
+    Сессия, которая не выполняет запросы, а запоминает их. Функции бота и API вызываются
+    с ней как с настоящей сессией, поэтому планы строятся ровно по тем запросам,
+    которые эти функции отправляют в базу, а не по их копиям.
+    """
+
+    def __init__(self):
+        self.statements: list[tuple[object, dict]] = []
+
+    async def execute(self, statement, params=None):
+        self.statements.append((statement, params or {}))
+        return _NoRows()
+
+    async def get(self, model, ident):
+        # Поиск по первичному ключу, который session.get отправил бы при промахе identity map
+        key = inspect(model).primary_key[0]
+        self.statements.append((select(model).filter(key == ident), {}))
+        return None
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+
+async def recorded(call) -> list[tuple[object, dict]]:
+    """Запросы, которые отправляет call(session)."""
+    session = StatementRecorder()
+    await call(session)
+    return session.statements
+
+
+async def hot_queries(poll_id: int, option_id: int, user_tg_id: int) -> list[tuple[str, object, dict]]:
+    """(название, запрос, параметры) для горячих путей commands.py, api/routes.py и poll_state.py."""
+    # Завершенный опрос (варианты из снимка) и активный (варианты из poll_option)
+    polls = [SimpleNamespace(id=poll_id, title="", status=False, closes_at=None),
+             SimpleNamespace(id=poll_id + 1, title="", status=True, closes_at=None)]
+    vote = [(option_id, user_tg_id, "explain")]
+    sharded = ShardedVoteCounts(shards=2)
+    calls = [
+        ("/api/polls: страница (keyset)", lambda session: fetch_polls_page(session, 50, after=poll_id + 1)),
+        ("/api/polls: варианты и снимки", lambda session: polls_out(session, polls)),
+        ("рендер опроса (снимок, затем варианты)", lambda session: get_poll_text_and_options(poll_id, session)),
+        ("итоги опросов (get_polls_tallies)", lambda session: get_polls_tallies(session, [poll_id])),
+        ("пачка голосов (record_votes_batch)", lambda session: record_votes_batch(session, vote)),
+        ("слоты счетчиков (шардирование)", lambda session: sharded.load(session, [poll_id])),
+    ]
+    queries = []
+    for name, call in calls:
+        for statement, params in await recorded(call):
+            queries.append((name, statement, params))
+    return queries + [
+        ("/poll: активные опросы", ACTIVE_POLLS_QUERY, {}),
+        ("отчет: страница проголосовавших", voters_page_query(poll_id, 50, after=0), {}),
+        ("отчет: поиск проголосовавших", voters_page_query(poll_id, 50, q="explain"), {}),
+        ("пачка голосов (RECORD_VOTES_BATCH_SHARDED_SQL)", RECORD_VOTES_BATCH_SHARDED_SQL,
+         {"option_ids": [option_id], "user_tg_ids": [user_tg_id], "user_full_names": ["explain"], "shards": 2}),
+        ("сверка счетчиков (mismatch_query)", mismatch_query([poll_id]), {}),
+        # Каскадное удаление опроса и варианта ищет строки по внешним ключам
+        ("удаление опроса: telegram_poll",
+         select(TelegramPoll).filter(TelegramPoll.poll_id == poll_id), {}),
+        ("удаление варианта: голоса",
+         select(User.id).filter(User.option_id == option_id), {}),
+    ]
+
+
+async def sample_ids(conn) -> tuple[int, int, int]:
+    """Берет реальные id из базы, чтобы планировщик видел правдоподобные значения."""
+    poll_id = (await conn.execute(select(func.max(Poll.id)))).scalar() or 1
+    option_id = (await conn.execute(
+        select(func.min(PollOption.id)).filter(PollOption.poll_id == poll_id))).scalar() or 1
+    user_tg_id = (await conn.execute(select(func.min(User.user_tg_id)))).scalar() or 1
+    return poll_id, option_id, user_tg_id
+
+
+async def main() -> None:
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("Планы имеют смысл только для PostgreSQL: проверьте DATABASE_URL.")
+
+    seq_scans = []
+    async with engine.connect() as conn:
+        for name, query, params in await hot_queries(*await sample_ids(conn)):
+            if not isinstance(query, TextClause):
+                query = text(str(query.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})))
+            plan = [row[0] for row in await conn.execute(text(f"EXPLAIN {query.text}"), params)]
+            print(f"=== {name}")
+            print("\n".join(plan), end="\n\n")
+            if any("Seq Scan" in line for line in plan):
+                seq_scans.append(name)
+        await conn.rollback()
+
+    if seq_scans:
+        # На маленьких таблицах Seq Scan нормален: смотрите планы на объемах, близких к боевым
+        print("Seq Scan в запросах:\n- " + "\n- ".join(seq_scans))
+    else:
+        print("Все горячие запросы используют индексы.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+# KorpBot/tools/fake_telegram.py
+"""
+Локальный "фейковый Telegram": отправляет синтетические обновления на вебхук бота.
+
+Примеры:
+    python -m tools.fake_telegram --text /poll
+    python -m tools.fake_telegram --callback vote_3 --user 42 --count 100
+"""
+
+import argparse
+import json
+import os
+import time
+import urllib.request
+
+
+def build_update(update_id: int, user_id: int, text: str | None = None, callback: str | None = None) -> dict:
+    """Собирает минимальный JSON обновления в формате Bot API."""
+    user = {"id": user_id, "is_bot": False, "first_name": f"Тестовый {user_id}"}
+    chat = {"id": user_id, "type": "private", "first_name": user["first_name"]}
+    message = {"message_id": update_id, "date": int(time.time()), "chat": chat, "from": user}
+    if callback:
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id), "from": user, "chat_instance": str(user_id),
+                "data": callback, "message": {**message, "text": "опрос"},
+            },
+        }
+    entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else []
+    return {"update_id": update_id, "message": {**message, "text": text, "entities": entities}}
+
+
+def send_update(url: str, secret: str, update: dict) -> int:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(update).encode("utf-8"),
+        headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret},
+        method="POST",
+    )
+    with urllib.request.urlopen(request) as response:
+        return response.status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отправка синтетических обновлений на вебхук бота")
+    parser.add_argument("--url", default="http://localhost:8000/telegram/webhook")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET", ""))
+    parser.add_argument("--user", type=int, default=1, help="Telegram ID первого отправителя")
+    parser.add_argument("--count", type=int, default=1, help="Сколько обновлений отправить (ID пользователей идут подряд)")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--text", help="Текст сообщения, например /poll")
+    group.add_argument("--callback", help="callback_data нажатой кнопки, например vote_3")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    for i in range(args.count):
+        update = build_update(int(time.time() * 1000) + i, args.user + i, args.text, args.callback)
+        send_update(args.url, args.secret, update)
+    elapsed = time.perf_counter() - started
+    print(f"Отправлено обновлений: {args.count} за {elapsed:.2f} с.")
+
+
+if __name__ == "__main__":
+    main()
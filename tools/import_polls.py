@@ -0,0 +1,153 @@
+# KorpBot/tools/import_polls.py
+"""
+Переносит опросы из старого хранилища storage.py (polls.json или журнал polls.jsonl)
+в таблицы poll, poll_option и user одной транзакцией: опросы и варианты вставляются
+пачками (executemany с RETURNING), голоса на PostgreSQL — через COPY, а завершенные
+опросы сразу получают снимок итогов (poll_snapshot).
+При любой ошибке не импортируется ничего.
+
+Записи старого формата понимаются такие:
+    {"title" | "question": "...", "options": ["...", ...] | [{"text": "..."}, ...],
+     "votes": [3, 1, ...] | {"вариант": 3, ...} | [{"user_id": 42, "user_name": "...", "option": 0 | "вариант"}, ...],
+     "created_at": "2024-05-01T12:00:00", "status": false}
+Без поля status опрос импортируется завершенным. Опрос, где сохранены только счетчики
+(без списка проголосовавших), импортируется завершенным всегда: его голоса пишутся
+в poll_option.imported_votes, и отчеты, снимки и сверка счетчиков учитывают их наравне
+с таблицей user.
+
+Пример:
+    DATABASE_URL=postgresql+asyncpg://... python -m tools.import_polls polls.json
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from database.main import engine, init_models
+from database.models import Poll, PollOption, PollSnapshot, User
+from poll_state import render_poll_text
+from storage import replay
+
+
+def read_legacy(path: str) -> list[dict]:
+    """Читает polls.json (один JSON-список) или журнал JSON Lines."""
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    if content.lstrip().startswith("["):
+        return json.loads(content)
+    polls, _, _ = replay(content.splitlines())
+    return polls
+
+
+def normalize(poll: dict) -> tuple[dict, list[str], list[int], list[tuple[int, str | None, int]]]:
+    """
+    Приводит запись старого формата к (строка poll, тексты вариантов, счетчики, голоса),
+    где голос — (user_tg_id, имя, индекс варианта). У пользователя остается последний голос.
+    """
+    title = poll.get("title") or poll.get("question")
+    options = [option if isinstance(option, str) else option.get("text") or option.get("option_text")
+               for option in poll.get("options", [])]
+    if not title or not options:
+        raise ValueError(f"Запись без вопроса или вариантов: {poll!r}")
+    index_by_text = {text: index for index, text in enumerate(options)}
+
+    counts = [0] * len(options)
+    voters: dict[int, tuple[int, str | None, int]] = {}
+    votes = poll.get("votes") or []
+    if isinstance(votes, dict):
+        for text, count in votes.items():
+            counts[index_by_text[text]] = int(count)
+    elif votes and isinstance(votes[0], dict):
+        for vote in votes:
+            option = vote["option"]
+            index = option if isinstance(option, int) else index_by_text[option]
+            user_tg_id = int(vote["user_id"])
+            voters[user_tg_id] = (user_tg_id, vote.get("user_name") or vote.get("user_full_name"), index)
+        for _, _, index in voters.values():
+            counts[index] += 1
+    else:
+        counts = [int(count) for count in votes] + [0] * (len(options) - len(votes))
+
+    created_at = datetime.fromisoformat(poll["created_at"]) if poll.get("created_at") else datetime.now()
+    counts_only = not voters and any(counts)
+    row = {"title": title[:255], "created_at": created_at,
+           "status": bool(poll.get("status", False)) and not counts_only, "closes_at": None, "version": 1}
+    return row, options, counts, list(voters.values())
+
+
+async def import_polls(polls: list[dict]) -> tuple[int, int, int]:
+    """Импортирует опросы одной транзакцией; возвращает (опросов, вариантов, голосов)."""
+    normalized = [normalize(poll) for poll in polls]
+    if not normalized:
+        return 0, 0, 0
+
+    async with engine.begin() as connection:
+        # sort_by_parameter_order: ID возвращаются в порядке строк, даже при пакетной вставке
+        result = await connection.execute(
+            insert(Poll).returning(Poll.id, sort_by_parameter_order=True),
+            [row for row, _, _, _ in normalized],
+        )
+        poll_ids = result.scalars().all()
+
+        option_rows = [
+            {"poll_id": poll_id, "option_text": text, "votes_count": count,
+             "imported_votes": 0 if voters else count}
+            for poll_id, (_, options, counts, voters) in zip(poll_ids, normalized)
+            for text, count in zip(options, counts)
+        ]
+        result = await connection.execute(
+            insert(PollOption).returning(PollOption.id, sort_by_parameter_order=True), option_rows
+        )
+        option_ids = iter(result.scalars().all())
+
+        vote_rows, snapshot_rows = [], []
+        for poll_id, (row, options, counts, voters) in zip(poll_ids, normalized):
+            ids = [next(option_ids) for _ in options]
+            vote_rows += [(poll_id, user_tg_id, ids[index], user_full_name, row["created_at"])
+                          for user_tg_id, user_full_name, index in voters]
+            if not row["status"]:
+                # Как при завершении в set_polls_status: итоги замораживаются в снимке
+                frozen = [PollOption(id=option_id, poll_id=poll_id, option_text=text, votes_count=count)
+                          for option_id, text, count in zip(ids, options, counts)]
+                snapshot_rows.append({
+                    "poll_id": poll_id, "title": row["title"], "version": row["version"],
+                    "total_voters": sum(counts),
+                    "options": [{"id": o.id, "option_text": o.option_text, "votes_count": o.votes_count}
+                                for o in frozen],
+                    "telegram_text": render_poll_text(row["title"], frozen), "created_at": row["created_at"],
+                })
+        if snapshot_rows:
+            await connection.execute(insert(PollSnapshot), snapshot_rows)
+        if vote_rows:
+            columns = ["poll_id", "user_tg_id", "option_id", "user_full_name", "voted_at"]
+            if connection.dialect.name == "postgresql":
+                raw = await connection.get_raw_connection()
+                await raw.driver_connection.copy_records_to_table(User.__tablename__, records=vote_rows,
+                                                                  columns=columns)
+            else:
+                await connection.execute(insert(User), [dict(zip(columns, vote)) for vote in vote_rows])
+    return len(poll_ids), len(option_rows), len(vote_rows)
+
+
+async def run(args) -> None:
+    await init_models()
+    polls = read_legacy(args.path)
+    started = time.perf_counter()
+    imported_polls, imported_options, imported_votes = await import_polls(polls)
+    print(f"Импортировано за {time.perf_counter() - started:.2f} с: опросов {imported_polls}, "
+          f"вариантов {imported_options}, голосов {imported_votes}.")
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Импорт опросов из polls.json / polls.jsonl в базу данных.")
+    parser.add_argument("path", help="файл polls.json или журнал polls.jsonl")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
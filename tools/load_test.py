@@ -0,0 +1,245 @@
+# KorpBot/tools/load_test.py
+"""
+Нагрузочный тест бота без Telegram: собирает настоящий Dispatcher (bot_factory),
+подменяет сессию Bot на запись исходящих вызовов API и прогоняет через feed_update
+тысячи синтетических обновлений vote_, results_ и /poll.
+
+Печатает пропускную способность, p50/p95/p99 времени обработки обновления,
+число SQL-запросов на обновление (основная база и реплика чтения), число нажатий,
+отклоненных анти-флудом, и проверку счетчиков голосов. Тест создает в базе
+DATABASE_URL собственный опрос и удаляет его в конце (если не указан --keep).
+Запись голосов написана под PostgreSQL: на SQLite измеряются только /poll и results_,
+а проверка счетчиков ожидаемо покажет расхождение.
+
+Пример:
+    DATABASE_URL=postgresql+asyncpg://... python -m tools.load_test --users 2000 --updates 20000
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetMe, SendMessage
+from aiogram.types import Chat, Message, Update, User as TelegramUser
+from prometheus_client import REGISTRY
+from sqlalchemy import event, func, select
+
+from bot_factory import create_dispatcher
+from database.main import async_session, engine, init_models, read_engine
+from database.models import Poll, PollOption, PollOptionCounter, User
+from edit_scheduler import edit_scheduler
+from poll_state import start_new_poll
+from throttling import ThrottlingMiddleware
+from tools.fake_telegram import build_update
+from vote_queue import vote_queue
+
+# Синтетические пользователи с ID подальше от настоящих (user.user_tg_id)
+USER_ID_BASE = 2_000_000_000
+
+
+class RecordingSession(BaseSession):
+    """Сессия Bot, которая ничего не отправляет в сеть, а только считает вызовы API."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls: Counter[str] = Counter()
+        self._message_id = 0
+
+    async def make_request(self, bot: Bot, method, timeout: int | None = None):
+        self.calls[type(method).__name__] += 1
+        if isinstance(method, GetMe):
+            return TelegramUser(id=bot.id, is_bot=True, first_name="LoadTest")
+        if isinstance(method, SendMessage):
+            self._message_id += 1
+            return Message(message_id=self._message_id, date=datetime.now(),
+                           chat=Chat(id=method.chat_id, type="private"), text=method.text)
+        # EditMessageText, AnswerCallbackQuery и прочее
+        return True
+
+    async def stream_content(self, url: str, headers=None, timeout: int = 30, chunk_size: int = 65536,
+                             raise_for_status: bool = True):
+        # Метод абстрактный в BaseSession; файлы в нагрузочном тесте не скачиваются — поток пустой
+        for chunk in ():
+            yield chunk
+
+    async def close(self) -> None:
+        pass
+
+
+class QueryCounter:
+    """Считает SQL-запросы, реально ушедшие в базу через engine и read_engine (реплику чтения)."""
+
+    def __init__(self):
+        self.count = 0
+        # Без DATABASE_READ_URL read_engine — тот же engine, и запрос не должен считаться дважды
+        self._engines = {engine.sync_engine, read_engine.sync_engine}
+
+    def __call__(self, *args) -> None:
+        self.count += 1
+
+    def __enter__(self):
+        for sync_engine in self._engines:
+            event.listen(sync_engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for sync_engine in self._engines:
+            event.remove(sync_engine, "before_cursor_execute", self)
+
+
+def throttled_counts() -> dict[str, float]:
+    """Нажатия, отклоненные анти-флудом с начала процесса, по префиксам кнопок (метрика bot_throttled_total)."""
+    return {
+        prefix: REGISTRY.get_sample_value("bot_throttled_total", {"handler": prefix}) or 0
+        for prefix in ("vote", "results")
+    }
+
+
+def build_workload(args, poll_id: int, option_ids: list[int]) -> list[tuple[str, dict]]:
+    """Список (вид, JSON обновления) в случайном, но воспроизводимом (--seed) порядке."""
+    rng = random.Random(args.seed)
+    kinds = ["vote", "results", "poll"]
+    weights = [args.vote_share, args.results_share, max(1.0 - args.vote_share - args.results_share, 0.0)]
+    workload = []
+    for update_id in range(1, args.updates + 1):
+        kind = rng.choices(kinds, weights)[0]
+        user_id = USER_ID_BASE + rng.randrange(args.users)
+        if kind == "vote":
+            update = build_update(update_id, user_id, callback=f"vote_{rng.choice(option_ids)}")
+        elif kind == "results":
+            update = build_update(update_id, user_id, callback=f"results_{poll_id}")
+        else:
+            update = build_update(update_id, user_id, text="/poll")
+        workload.append((kind, update))
+    return workload
+
+
+def percentiles(samples: list[float]) -> str:
+    if len(samples) < 2:
+        return "недостаточно данных"
+    cuts = statistics.quantiles(samples, n=100)
+    return f"p50 {cuts[49] * 1000:.1f} мс, p95 {cuts[94] * 1000:.1f} мс, p99 {cuts[98] * 1000:.1f} мс"
+
+
+async def check_counters(poll_id: int, expected_voters: int) -> tuple[bool, list[str]]:
+    """
+    Денормализованные votes_count должны совпадать с числом голосов в таблице user,
+    а проголосовавших должно быть ровно столько, сколько разных пользователей нажимали vote_.
+    """
+    async with async_session() as session:
+        voters = await session.scalar(select(func.count(User.id)).filter(User.poll_id == poll_id))
+        result = await session.execute(
+            select(PollOption.id, PollOption.votes_count, func.count(User.id))
+            .outerjoin(User, User.option_id == PollOption.id)
+            .filter(PollOption.poll_id == poll_id)
+            .group_by(PollOption.id)
+            .order_by(PollOption.id)
+        )
+        rows = result.all()
+        # В режиме шардированных счетчиков к votes_count добавляются слоты poll_option_counter
+        result = await session.execute(
+            select(PollOptionCounter.option_id, func.sum(PollOptionCounter.votes))
+            .filter(PollOptionCounter.poll_id == poll_id).group_by(PollOptionCounter.option_id)
+        )
+        slots = dict(result.all())
+    rows = [(option_id, stored + slots.get(option_id, 0), actual) for option_id, stored, actual in rows]
+    lines = [f"проголосовали: {voters} из {expected_voters}"]
+    lines += [f"вариант {option_id}: votes_count={stored}, голосов={actual}" for option_id, stored, actual in rows]
+    return voters == expected_voters and all(stored == actual for _, stored, actual in rows), lines
+
+
+async def run(args) -> None:
+    await init_models()
+    async with async_session() as session:
+        poll_id = await start_new_poll(session, "Нагрузочный тест", [f"Вариант {i + 1}" for i in range(args.options)])
+        result = await session.execute(select(PollOption.id).filter_by(poll_id=poll_id).order_by(PollOption.id))
+        option_ids = result.scalars().all()
+
+    fake_session = RecordingSession()
+    bot = Bot(token="123456:LOADTEST", session=fake_session)
+    dp = create_dispatcher()
+    if not args.throttle:
+        # Синтетические пользователи нажимают кнопки чаще живых: анти-флуд отбросил бы
+        # часть нагрузки, и тест измерял бы не хэндлеры, а отказы
+        for middleware in dp.callback_query.outer_middleware:
+            if isinstance(middleware, ThrottlingMiddleware):
+                middleware.limits = {}
+    workload = build_workload(args, poll_id, option_ids)
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors = Counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def feed(kind: str, payload: dict) -> None:
+        update = Update.model_validate(payload, context={"bot": bot})
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await dp.feed_update(bot, update)
+            except Exception as e:
+                errors[f"{kind}: {type(e).__name__}"] += 1
+            latencies[kind].append(time.perf_counter() - started)
+
+    throttled_before = throttled_counts()
+    vote_queue.start()
+    with QueryCounter() as queries:
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(feed(kind, payload) for kind, payload in workload))
+            elapsed = time.perf_counter() - started
+        finally:
+            # Голоса и правки, еще лежащие в очередях, тоже часть нагрузки
+            await vote_queue.close()
+            await edit_scheduler.close()
+
+    expected_voters = len({payload["callback_query"]["from"]["id"] for kind, payload in workload if kind == "vote"})
+    counters_ok, counter_lines = await check_counters(poll_id, expected_voters)
+    all_latencies = [value for values in latencies.values() for value in values]
+    print(f"Обновлений: {len(workload)} за {elapsed:.2f} с — {len(workload) / elapsed:.0f} обновл./с")
+    print(f"Все обновления: {percentiles(all_latencies)}")
+    for kind, values in sorted(latencies.items()):
+        print(f"  {kind} ({len(values)}): {percentiles(values)}")
+    print(f"SQL-запросов: {queries.count} — {queries.count / len(workload):.2f} на обновление")
+    throttled = {prefix: int(count - throttled_before[prefix]) for prefix, count in throttled_counts().items()}
+    print(f"Анти-флуд {'включен' if args.throttle else 'выключен'}, отклонено нажатий: "
+          + ", ".join(f"{prefix}={count}" for prefix, count in throttled.items()))
+    print("Вызовы Bot API: " + ", ".join(f"{name}={count}" for name, count in fake_session.calls.most_common()))
+    if errors:
+        print("Ошибки: " + ", ".join(f"{name}={count}" for name, count in errors.most_common()))
+    print("Счетчики голосов: " + ("совпадают" if counters_ok else "РАСХОДЯТСЯ"))
+    for line in counter_lines:
+        print(f"  {line}")
+
+    if not args.keep:
+        async with async_session() as session:
+            poll = await session.get(Poll, poll_id)
+            await session.delete(poll)
+            await session.commit()
+    await dp.storage.close()
+
+    if not counters_ok:
+        raise SystemExit(1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест хэндлеров бота через Dispatcher.feed_update.")
+    parser.add_argument("--updates", type=int, default=5000, help="сколько обновлений отправить")
+    parser.add_argument("--users", type=int, default=1000, help="сколько разных пользователей")
+    parser.add_argument("--options", type=int, default=4, help="вариантов ответа в тестовом опросе")
+    parser.add_argument("--concurrency", type=int, default=200, help="обновлений в обработке одновременно")
+    parser.add_argument("--vote-share", type=float, default=0.8, help="доля нажатий vote_")
+    parser.add_argument("--results-share", type=float, default=0.15, help="доля нажатий results_ (остальное — /poll)")
+    parser.add_argument("--seed", type=int, default=1, help="зерно генератора нагрузки")
+    parser.add_argument("--keep", action="store_true", help="не удалять тестовый опрос после прогона")
+    parser.add_argument("--throttle", action="store_true",
+                        help="оставить анти-флуд с боевыми лимитами (по умолчанию выключен)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
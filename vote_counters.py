@@ -0,0 +1,209 @@
+# KorpBot/vote_counters.py
+
+import asyncio
+import logging
+import time
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from config import VOTE_COUNTER_SHARDS, VOTE_COUNTS_CACHE_TTL_SECONDS, VOTE_RECONCILE_INTERVAL_SECONDS
+from database.main import async_session, mark_written
+from database.models import Poll, PollOption, PollOptionCounter, User
+from metrics import VOTE_COUNTER_MISMATCHES
+from poll_cache import poll_cache
+from poll_state import notify_poll_changed
+
+logger = logging.getLogger(__name__)
+
+
+class ShardedVoteCounts:
+    """
+    Чтение шардированных счетчиков (VOTE_COUNTER_SHARDS > 1): итог варианта — это
+    poll_option.votes_count плюс сумма его слотов в poll_option_counter.
+    Суммы по опросу кэшируются на ttl_seconds; голос, записанный этим процессом
+    (poll_cache.bump), сразу делает закэшированную сумму устаревшей.
+    Без шардирования все методы ничего не запрашивают.
+    """
+
+    def __init__(self, shards: int, ttl_seconds: float = 1.0, maxsize: int = 4096):
+        self.enabled = shards > 1
+        self.ttl = ttl_seconds
+        self.maxsize = maxsize
+        # poll_id -> (время загрузки, локальная версия опроса, изменений слотов, {option_id: голоса})
+        self._entries: dict[int, tuple[float, int, int, dict[int, int]]] = {}
+
+    async def load(self, session: AsyncSession, poll_ids) -> dict[int, tuple[int, dict[int, int]]]:
+        """{poll_id: (изменений слотов, {option_id: сумма слотов})} одним GROUP BY на промахи кэша."""
+        now = time.monotonic()
+        counts, missing = {}, {}
+        for poll_id in set(poll_ids):
+            entry = self._entries.get(poll_id)
+            if entry and now - entry[0] < self.ttl and entry[1] == poll_cache.version(poll_id):
+                counts[poll_id] = entry[2:]
+            else:
+                missing[poll_id] = poll_cache.version(poll_id)
+        if not missing:
+            return counts
+
+        result = await session.execute(
+            select(PollOptionCounter.poll_id, PollOptionCounter.option_id,
+                   func.sum(PollOptionCounter.votes), func.sum(PollOptionCounter.changes))
+            .filter(PollOptionCounter.poll_id.in_(missing))
+            .group_by(PollOptionCounter.poll_id, PollOptionCounter.option_id)
+        )
+        loaded = {poll_id: [0, {}] for poll_id in missing}
+        for poll_id, option_id, votes, changes in result:
+            loaded[poll_id][0] += changes
+            loaded[poll_id][1][option_id] = votes
+        if len(self._entries) + len(loaded) > self.maxsize:
+            self._entries.clear()
+        for poll_id, (changes, votes) in loaded.items():
+            self._entries[poll_id] = (now, missing[poll_id], changes, votes)
+            counts[poll_id] = (changes, votes)
+        return counts
+
+    async def option_votes(self, session: AsyncSession, poll_ids) -> dict[int, int]:
+        """{option_id: сумма слотов} для вариантов опросов; без шардирования — пустой словарь."""
+        if not self.enabled or not poll_ids:
+            return {}
+        counts = await self.load(session, poll_ids)
+        return {option_id: votes for _, option_votes in counts.values() for option_id, votes in option_votes.items()}
+
+    async def apply(self, session: AsyncSession, options: list[PollOption]) -> None:
+        """Добавляет к votes_count вариантов суммы их слотов, не помечая объекты измененными."""
+        if not self.enabled or not options:
+            return
+        slot_votes = await self.option_votes(session, {option.poll_id for option in options})
+        for option in options:
+            votes = slot_votes.get(option.id, 0)
+            if votes:
+                set_committed_value(option, "votes_count", (option.votes_count or 0) + votes)
+
+    async def versions(self, session: AsyncSession, polls) -> dict[int, int]:
+        """
+        Версии опросов для ETag и кэшей отчетов: Poll.version плюс число изменений слотов,
+        ведь голоса в режиме шардирования Poll.version не увеличивают.
+        """
+        if not self.enabled:
+            return {poll.id: poll.version for poll in polls}
+        counts = await self.load(session, [poll.id for poll in polls])
+        return {poll.id: poll.version + counts[poll.id][0] for poll in polls}
+
+
+def mismatch_query(poll_ids: list[int] | None = None):
+    """
+    Варианты активных опросов, у которых сохраненный итог (votes_count + слоты)
+    расходится с числом голосов в таблице user; истинные итоги — одним GROUP BY.
+    Голоса, импортированные без проголосовавших (imported_votes), входят в истинный итог.
+    """
+    actual = (
+        select(User.option_id, func.count(User.id).label("votes"))
+        .join(Poll, Poll.id == User.poll_id).filter(Poll.status.is_(True))
+        .group_by(User.option_id)
+    )
+    slots = select(PollOptionCounter.option_id, func.sum(PollOptionCounter.votes).label("votes"))
+    if poll_ids is not None:
+        actual = actual.filter(User.poll_id.in_(poll_ids))
+        slots = slots.filter(PollOptionCounter.poll_id.in_(poll_ids))
+    actual = actual.subquery()
+    slots = slots.group_by(PollOptionCounter.option_id).subquery()
+
+    stored = func.coalesce(PollOption.votes_count, 0) + func.coalesce(slots.c.votes, 0)
+    actual_votes = func.coalesce(actual.c.votes, 0) + PollOption.imported_votes
+    query = (
+        select(PollOption.id.label("option_id"), PollOption.poll_id,
+               stored.label("stored"), actual_votes.label("actual"))
+        .join(Poll, Poll.id == PollOption.poll_id).filter(Poll.status.is_(True))
+        .outerjoin(slots, slots.c.option_id == PollOption.id)
+        .outerjoin(actual, actual.c.option_id == PollOption.id)
+        .filter(stored != actual_votes)
+        .order_by(PollOption.id)
+    )
+    if poll_ids is not None:
+        query = query.filter(PollOption.poll_id.in_(poll_ids))
+    return query
+
+
+async def reconcile_vote_counters() -> list:
+    """
+    Сверяет счетчики активных опросов с таблицей user (плюс imported_votes) и исправляет
+    расхождения: в votes_count записывается истинный итог, слоты варианта удаляются.
+    Опросы с расхождениями блокируются, поэтому голоса на время исправления ждут,
+    а пересчет под блокировкой точный. Возвращает исправленные строки
+    (option_id, poll_id, stored, actual).
+    """
+    async with async_session() as session:
+        # Поиск без блокировок: обычно расхождений нет, и сверка на этом заканчивается
+        candidates = (await session.execute(mismatch_query())).all()
+        if not candidates:
+            return []
+        try:
+            poll_ids = sorted({row.poll_id for row in candidates})
+            await session.execute(select(Poll.id).filter(Poll.id.in_(poll_ids)).order_by(Poll.id).with_for_update())
+            mismatches = (await session.execute(mismatch_query(poll_ids))).all()
+            if not mismatches:
+                await session.rollback()
+                return []
+
+            option_ids = [row.option_id for row in mismatches]
+            poll_ids = sorted({row.poll_id for row in mismatches})
+            # Удаленные изменения слотов переносятся в Poll.version, чтобы ETag не пошел назад
+            changes = dict((await session.execute(
+                select(PollOptionCounter.poll_id, func.sum(PollOptionCounter.changes))
+                .filter(PollOptionCounter.option_id.in_(option_ids))
+                .group_by(PollOptionCounter.poll_id)
+            )).all())
+            await session.execute(update(PollOption), [
+                {"id": row.option_id, "votes_count": row.actual} for row in mismatches
+            ])
+            await session.execute(delete(PollOptionCounter).where(PollOptionCounter.option_id.in_(option_ids)))
+            for poll_id in poll_ids:
+                await session.execute(
+                    update(Poll).where(Poll.id == poll_id).values(version=Poll.version + changes.get(poll_id, 0) + 1)
+                )
+            await notify_poll_changed(session, poll_ids)
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+
+    for poll_id in poll_ids:
+        poll_cache.bump(poll_id)
+        mark_written(poll_id)
+    for row in mismatches:
+        logger.warning(f"Счетчик варианта {row.option_id} (опрос {row.poll_id}) расходился с голосами: "
+                       f"было {row.stored}, исправлено на {row.actual}.")
+    VOTE_COUNTER_MISMATCHES.inc(len(mismatches))
+    return mismatches
+
+
+class VoteCounterReconciler:
+    """Периодическая сверка счетчиков голосов (reconcile_vote_counters) в фоне процесса бота."""
+
+    def __init__(self, interval_seconds: float):
+        self.interval = interval_seconds
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await reconcile_vote_counters()
+            except Exception as e:
+                logger.error(f"Сверка счетчиков голосов не удалась: {e}")
+
+
+vote_counts = ShardedVoteCounts(VOTE_COUNTER_SHARDS, ttl_seconds=VOTE_COUNTS_CACHE_TTL_SECONDS)
+vote_reconciler = VoteCounterReconciler(VOTE_RECONCILE_INTERVAL_SECONDS)
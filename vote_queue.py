@@ -0,0 +1,149 @@
+# KorpBot/vote_queue.py
+
+import asyncio
+import logging
+
+from config import VOTE_BATCH_SIZE, VOTE_COUNTER_SHARDS, VOTE_FLUSH_INTERVAL_MS
+from database.main import async_session
+from poll_state import bump_poll_versions, record_votes_batch
+
+logger = logging.getLogger(__name__)
+
+
+# Через сколько секунд простоя очереди повторить неудавшееся увеличение версий опросов
+BUMP_RETRY_SECONDS = 1.0
+
+
+class VoteQueue:
+    """
+    Буфер входящих голосов. Хэндлер сразу отвечает пользователю и кладет голос
+    в очередь, а фоновая задача пишет голоса в БД пачками: не реже, чем раз
+    в flush_interval_ms, и не больше batch_size голосов за одну транзакцию.
+    Версии опросов, которые не удалось увеличить после записи голосов, копятся
+    и увеличиваются со следующей пачкой или после BUMP_RETRY_SECONDS простоя.
+    """
+
+    def __init__(self, batch_size: int = 200, flush_interval_ms: int = 50):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        # Опросы с записанными голосами, чья версия еще не увеличена
+        self._unbumped: set[int] = set()
+
+    def start(self) -> None:
+        """Запускает фоновую запись голосов в текущем event loop."""
+        if self._task:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Останавливает прием голосов и дожидается записи всего, что уже в очереди."""
+        if not self._task:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        logger.info("Очередь голосов записана в БД.")
+
+    def submit(self, option_id: int, user_tg_id: int, user_full_name: str) -> asyncio.Future:
+        """
+        Ставит голос в очередь. Возвращает future, который завершится после записи
+        пачки в БД с poll_id опроса (или None, если варианта ответа уже нет).
+        """
+        if not self._task:
+            raise RuntimeError("Очередь голосов не запущена.")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((option_id, user_tg_id, user_full_name, future))
+        return future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            if self._unbumped:
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), BUMP_RETRY_SECONDS)
+                except asyncio.TimeoutError:
+                    await self._bump_versions()
+                    continue
+            else:
+                item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+        if self._unbumped:
+            # Последняя попытка перед остановкой, иначе ETag этих опросов устареют до их следующего изменения
+            await self._bump_versions()
+            if self._unbumped:
+                logger.error(f"Версии опросов {sorted(self._unbumped)} не увеличены при остановке.")
+
+    async def _flush(self, batch: list) -> None:
+        # Повторные нажатия одной и той же кнопки схлопываются еще до БД,
+        # переключения голоса внутри опроса разрешает сам SQL (побеждает последний)
+        # (порядок важен: оставляем последнее вхождение каждого голоса)
+        votes = {}
+        for option_id, user_tg_id, name, _ in reversed(batch):
+            votes.setdefault((option_id, user_tg_id), (option_id, user_tg_id, name))
+        votes = list(reversed(votes.values()))
+        errors = {}
+        try:
+            async with async_session() as session:
+                poll_ids = await record_votes_batch(session, votes)
+        except Exception as e:
+            # Один плохой голос не должен ронять всю пачку: пишем ее по одному голосу
+            logger.error(f"Не удалось записать пачку из {len(batch)} голосов, запись по одному: {e}")
+            poll_ids, errors = await self._record_one_by_one(votes)
+
+        for option_id, user_tg_id, _, future in batch:
+            if future.done():
+                continue
+            error = errors.get((option_id, user_tg_id))
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(poll_ids.get(option_id))
+
+        # Версии опросов растут отдельной транзакцией уже после ответа голосующим;
+        # в режиме шардирования их заменяют счетчики изменений слотов
+        if poll_ids and VOTE_COUNTER_SHARDS <= 1:
+            self._unbumped.update(poll_ids.values())
+        if self._unbumped:
+            await self._bump_versions()
+
+    async def _bump_versions(self) -> None:
+        """Увеличивает версии накопленных опросов; при ошибке они остаются до следующей попытки."""
+        poll_ids = set(self._unbumped)
+        async with async_session() as session:
+            if await bump_poll_versions(session, poll_ids):
+                self._unbumped -= poll_ids
+
+    async def _record_one_by_one(self, votes: list) -> tuple[dict, dict]:
+        """Пишет голоса отдельными транзакциями; возвращает (option_id -> poll_id, ошибки по голосам)."""
+        poll_ids, errors = {}, {}
+        for vote in votes:
+            try:
+                async with async_session() as session:
+                    poll_ids.update(await record_votes_batch(session, [vote]))
+            except Exception as e:
+                logger.error(f"Не удалось записать голос пользователя {vote[1]} за вариант {vote[0]}: {e}")
+                errors[vote[:2]] = e
+        return poll_ids, errors
+
+
+vote_queue = VoteQueue(batch_size=VOTE_BATCH_SIZE, flush_interval_ms=VOTE_FLUSH_INTERVAL_MS)